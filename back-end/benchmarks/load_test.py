@@ -0,0 +1,281 @@
+"""
+端到端负载测试
+- 启动替身后端（Ollama/TTS/Whisper）和应用进程
+- 并发客户端请求 /chat（流式NDJSON）和 /conversation（上传音频）
+- 统计首段文本延迟、首段音频延迟、总耗时、吞吐量及p50/p95/p99
+- 可用 --output 把结果追加到JSON Lines文件，便于不同提交之间对比
+
+示例: python -m benchmarks.load_test --clients 8 --requests 64 --scenario chat_stream
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from aiohttp import web
+import numpy as np
+from benchmarks import stub_backends
+from benchmarks.results import append_result
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["chat", "chat_stream", "conversation"]
+
+MESSAGES = [
+    "Hi, how are you today?",
+    "Tell me something nice about the weather.",
+    "I had a long day at work, can you cheer me up?",
+    "What should I cook for dinner tonight?",
+]
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def percentiles(values):
+    """返回一组耗时的均值和p50/p95/p99，单位毫秒"""
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def load_upload_audio(path):
+    """读取上传用的音频；未指定时生成2秒的16kHz测试音"""
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    return stub_backends.make_wav(2.0, 16000)
+
+
+async def ndjson_events(response):
+    """逐个解析NDJSON事件；音频以base64内嵌，单行可能超过aiohttp的行长度限制"""
+    buffer = b""
+    async for chunk in response.content.iter_any():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+async def chat_request(session, base_url, index, args):
+    """发送一次/chat请求，记录首段文本、首段音频和总耗时"""
+    payload = {
+        "message": MESSAGES[index % len(MESSAGES)],
+        "speaker": args.speaker,
+        "stream_text": args.scenario == "chat_stream",
+        "audio_format": args.audio_format
+    }
+    result = {"ok": False, "first_text": None, "first_audio": None, "total": None, "segments": 0}
+    start = time.monotonic()
+    async with session.post(f"{base_url}/chat", json=payload) as response:
+        result["status"] = response.status
+        if response.status != 200:
+            await response.read()
+            return result
+        async for event in ndjson_events(response):
+            kind = event.get("type")
+            now = time.monotonic() - start
+            if kind in ("text", "text_delta") and result["first_text"] is None:
+                result["first_text"] = now
+            elif kind == "audio":
+                result["segments"] += 1
+                if result["first_audio"] is None:
+                    result["first_audio"] = now
+            elif "error" in event:
+                result["error"] = event["error"]
+                return result
+    result["total"] = time.monotonic() - start
+    result["ok"] = result["first_audio"] is not None
+    return result
+
+
+async def conversation_request(session, base_url, index, args):
+    """发送一次/conversation请求；该端点一次性返回，首段文本即总耗时"""
+    form = aiohttp.FormData()
+    form.add_field("file", io.BytesIO(args.upload_audio), filename="input.wav", content_type="audio/wav")
+    form.add_field("sample_rate", "16000")
+    form.add_field("speaker", args.speaker)
+    result = {"ok": False, "first_text": None, "first_audio": None, "total": None, "segments": 0}
+    start = time.monotonic()
+    async with session.post(f"{base_url}/conversation", data=form) as response:
+        result["status"] = response.status
+        body = await response.json(content_type=None)
+    result["total"] = time.monotonic() - start
+    result["first_text"] = result["total"]
+    result["ok"] = response.status == 200 and "error" not in body
+    result["error"] = body.get("error")
+    return result
+
+
+async def run_scenario(base_url, args):
+    """以固定并发数发送请求，返回汇总结果"""
+    send = conversation_request if args.scenario == "conversation" else chat_request
+    counter = iter(range(args.requests))
+    results = []
+
+    async def client(session):
+        for index in counter:
+            try:
+                results.append(await send(session, base_url, index, args))
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                logger.warning(f"请求{index}失败: {e}")
+                results.append({"ok": False, "status": None, "error": str(e) or type(e).__name__})
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        # 预热：建立连接并触发首次请求的初始化
+        for index in range(args.warmup):
+            await send(session, base_url, index, args)
+        start = time.monotonic()
+        await asyncio.gather(*(client(session) for _ in range(args.clients)))
+        elapsed = time.monotonic() - start
+
+    succeeded = [r for r in results if r["ok"]]
+    statuses = {}
+    errors = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+        if r.get("error"):
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "scenario": args.scenario,
+        "clients": args.clients,
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "statuses": statuses,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(succeeded) / elapsed if elapsed else 0.0,
+        "first_text_ms": percentiles([r["first_text"] for r in succeeded if r["first_text"] is not None]),
+        "first_audio_ms": percentiles([r["first_audio"] for r in succeeded if r["first_audio"] is not None]),
+        "total_ms": percentiles([r["total"] for r in succeeded]),
+        "segments_per_request": float(np.mean([r["segments"] for r in succeeded])) if succeeded else 0.0
+    }
+
+
+def print_summary(summary, backend_stats):
+    """打印结果表格"""
+    print(f"\n场景: {summary['scenario']}  并发: {summary['clients']}  "
+          f"请求: {summary['requests']}  成功: {summary['succeeded']}  失败: {summary['failed']}  "
+          f"状态码: {summary['statuses']}")
+    print(f"耗时: {summary['elapsed_seconds']:.2f}s  吞吐量: {summary['throughput_rps']:.2f} req/s  "
+          f"每请求音频段数: {summary['segments_per_request']:.1f}")
+    for message, count in summary["errors"].items():
+        print(f"错误 x{count}: {message}")
+    print(f"{'':<14}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, label in [("first_text_ms", "首段文本"), ("first_audio_ms", "首段音频"), ("total_ms", "总耗时")]:
+        stats = summary[name]
+        if stats:
+            print(f"{label:<12}" + "".join(f"{stats[k]:>10.0f}" for k in ("mean", "p50", "p95", "p99")))
+    print(f"后端调用次数: {backend_stats}")
+
+
+async def start_stubs(args):
+    """在当前事件循环中启动替身后端"""
+    runner = web.AppRunner(stub_backends.create_app(args), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.stub_port).start()
+    return runner
+
+
+def start_app(args, workdir):
+    """启动应用子进程"""
+    command = [
+        sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "serve_app.py"),
+        "--port", str(args.app_port),
+        "--backend", f"http://127.0.0.1:{args.stub_port}",
+        "--workdir", workdir
+    ]
+    for item in args.set:
+        command += ["--set", item]
+    log = open(os.path.join(workdir, "app.log"), "w")
+    return subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log
+
+
+async def wait_until_ready(base_url, process, timeout=60):
+    """等待应用开始接受请求"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("应用进程已退出，请查看app.log")
+            try:
+                async with session.get(f"{base_url}/admission/stats") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError("等待应用启动超时")
+
+
+async def run(args):
+    runner = await start_stubs(args)
+    workdir = tempfile.mkdtemp(prefix="weebo-bench-")
+    process, log = start_app(args, workdir)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        await wait_until_ready(base_url, process)
+        logger.info(f"应用已启动，工作目录: {workdir}")
+        summary = await run_scenario(base_url, args)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{args.stub_port}/stats") as response:
+                backend_stats = await response.json()
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        await runner.cleanup()
+
+    summary["settings"] = {
+        key: value for key, value in vars(args).items() if key not in ("upload_audio", "output")
+    }
+    summary["backend_calls"] = backend_stats
+    print_summary(summary, backend_stats)
+    if args.output:
+        append_result(args.output, {"benchmark": "load_test", **summary})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端负载测试")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="chat_stream",
+                        help="chat: 整段文本后合成; chat_stream: 逐句流式; conversation: 语音输入")
+    parser.add_argument("--clients", type=int, default=4, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=32, help="请求总数")
+    parser.add_argument("--warmup", type=int, default=1, help="正式测试前的预热请求数")
+    parser.add_argument("--audio-format", default="wav", help="/chat返回的音频编码")
+    parser.add_argument("--speaker", default="default")
+    parser.add_argument("--upload-file", help="/conversation上传的音频文件，默认生成测试音")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时时间")
+    parser.add_argument("--app-port", type=int, default=9912)
+    parser.add_argument("--stub-port", type=int, default=9911)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖应用的config配置")
+    parser.add_argument("--output", help="把结果追加到此JSON Lines文件")
+    stub_backends.add_arguments(parser)
+    args = parser.parse_args()
+    args.upload_audio = load_upload_audio(args.upload_file)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
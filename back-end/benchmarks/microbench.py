@@ -0,0 +1,253 @@
+"""
+热路径函数的微基准测试
+- 音频：detect_silence、split_audio_at_silence、resample_audio、normalize_audio，输入为audio_cache中的WAV
+- 文本：AdaptiveSegmenter（整段切分和流式切分）、TTS服务器的split_text，输入为数据库中保存的消息
+- LLMService._clean_response、SpeechToTextModel._post_process_transcript
+- 每个用例对整个语料跑一遍计为一次，重复多次取最小值和中位数
+- 可用 --output 把结果追加到JSON Lines文件，并与文件中上一次（其他提交）的结果对比
+
+示例: python -m benchmarks.microbench --output microbench.jsonl
+"""
+import argparse
+import ast
+import json
+import logging
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import timeit
+from typing import List
+import numpy as np
+import soundfile as sf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils import audio_utils
+from utils.text_utils import AdaptiveSegmenter
+from services.llm_service import LLMService
+from models.stt_model import SpeechToTextModel
+from benchmarks import stub_backends
+from benchmarks.results import append_result, load_results
+
+TTS_SERVER_API = os.path.join(os.path.dirname(BACKEND_DIR), "tts_server", "api.py")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_audio_corpus(directory, max_files):
+    """读取audio_cache中的WAV，转为单声道float32"""
+    corpus = []
+    if os.path.isdir(directory):
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".wav"))
+        for name in names[:max_files]:
+            try:
+                audio, sample_rate = sf.read(os.path.join(directory, name), dtype="float32")
+            except RuntimeError as e:
+                logger.warning(f"跳过无法读取的音频 {name}: {e}")
+                continue
+            if audio.ndim > 1:
+                audio = audio.mean(axis=1)
+            corpus.append((audio, sample_rate))
+
+    if not corpus:
+        # 没有缓存音频时用合成语音代替：有声段与静音段交替
+        logger.warning(f"{directory}中没有WAV，使用合成音频")
+        sample_rate = 24000
+        for seconds in (2, 5, 10):
+            tone = np.frombuffer(stub_backends.make_wav(seconds, sample_rate)[44:], dtype=np.int16)
+            audio = tone.astype(np.float32) / 32768
+            audio[(np.arange(len(audio)) // sample_rate) % 2 == 1] = 0.0
+            corpus.append((audio, sample_rate))
+    return corpus
+
+
+def load_text_corpus(db_path):
+    """读取数据库中保存的消息：助手回复的英文、中文，以及用户输入"""
+    english, chinese, user = [], [], []
+    if os.path.exists(db_path):
+        connection = sqlite3.connect(db_path)
+        try:
+            rows = connection.execute("SELECT role, content FROM messages").fetchall()
+        finally:
+            connection.close()
+        for role, content in rows:
+            if not content:
+                continue
+            if role == "user":
+                user.append(content)
+                continue
+            try:
+                message = json.loads(content)
+            except json.JSONDecodeError:
+                english.append(content)
+                continue
+            if message.get("english"):
+                english.append(message["english"])
+            if message.get("chinese"):
+                chinese.append(message["chinese"])
+
+    if not english:
+        logger.warning(f"{db_path}中没有消息，使用固定文本")
+        english = [stub_backends.reply_text(i, 6) for i in range(20)]
+        chinese = [stub_backends.TRANSLATION] * 20
+        user = list(stub_backends.REPLY_SENTENCES)
+    return english, chinese, user
+
+
+def load_tts_split_text():
+    """从tts_server/api.py中取出split_text；该模块依赖torch和zonos，不能直接导入"""
+    with open(TTS_SERVER_API, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    function = next(node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == "split_text")
+    namespace = {"List": List}
+    exec(compile(ast.Module(body=[function], type_ignores=[]), TTS_SERVER_API, "exec"), namespace)
+    return namespace["split_text"]
+
+
+def stream_chunks(text, size=4):
+    """把文本切成类似LLM流式输出的小块"""
+    words = text.split(" ")
+    return [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+
+def build_cases(audio_corpus, english, chinese, user):
+    """构建用例：名称 -> (对整个语料执行一遍的函数, 语料条数)"""
+    cases = {}
+
+    def audio_case(function):
+        return lambda: [function(audio, sample_rate) for audio, sample_rate in audio_corpus]
+
+    cases["audio.detect_silence"] = (
+        audio_case(lambda audio, sr: audio_utils.detect_silence(audio, sample_rate=sr)), len(audio_corpus)
+    )
+    cases["audio.split_audio_at_silence"] = (
+        audio_case(lambda audio, sr: audio_utils.split_audio_at_silence(audio, sample_rate=sr)), len(audio_corpus)
+    )
+    cases["audio.resample_audio"] = (
+        audio_case(lambda audio, sr: audio_utils.resample_audio(audio, sr, 16000)), len(audio_corpus)
+    )
+    cases["audio.normalize_audio"] = (
+        audio_case(lambda audio, sr: audio_utils.normalize_audio(audio)), len(audio_corpus)
+    )
+
+    texts = english + chinese
+    cases["text.segmenter_split"] = (
+        lambda: [AdaptiveSegmenter().split(text) for text in texts], len(texts)
+    )
+
+    streamed = [stream_chunks(text) for text in english]
+
+    def segmenter_stream():
+        for chunks in streamed:
+            segmenter = AdaptiveSegmenter()
+            for chunk in chunks:
+                segmenter.feed(chunk)
+            segmenter.flush()
+
+    cases["text.segmenter_stream"] = (segmenter_stream, len(streamed))
+
+    if os.path.exists(TTS_SERVER_API):
+        split_text = load_tts_split_text()
+        cases["text.tts_server_split_text"] = (lambda: [split_text(text) for text in texts], len(texts))
+    else:
+        logger.warning(f"找不到{TTS_SERVER_API}，跳过split_text")
+
+    llm = LLMService(api_url="")
+    cases["llm.clean_response"] = (lambda: [llm._clean_response(text) for text in english], len(english))
+
+    stt = SpeechToTextModel(api_url="")
+    transcripts = user + [text.lower() for text in english]
+    cases["stt.post_process_transcript"] = (
+        lambda: [stt._post_process_transcript(text) for text in transcripts], len(transcripts)
+    )
+    return cases
+
+
+def measure(function, repeat, min_seconds):
+    """对一次完整的语料执行计时，重复到累计至少min_seconds或达到repeat次"""
+    function()  # 预热：首次调用会编译正则、导入scipy等
+    timer = timeit.Timer(function)
+    timings = []
+    while len(timings) < repeat or sum(timings) < min_seconds:
+        timings.extend(timer.repeat(repeat=1, number=1))
+        if len(timings) >= repeat * 20:
+            break
+    return timings
+
+
+def previous_results(path, revision):
+    """文件中最近一次来自其他提交的结果，按用例名索引"""
+    for record in reversed(load_results(path, "microbench")):
+        if record.get("revision") != revision:
+            return record.get("revision"), record.get("cases", {})
+    return None, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热路径函数的微基准测试")
+    parser.add_argument("--audio-dir", default=os.path.join(BACKEND_DIR, "audio_cache"), help="WAV语料目录")
+    parser.add_argument("--db", default=os.path.join(BACKEND_DIR, "data", "messages.db"), help="消息数据库")
+    parser.add_argument("--max-audio-files", type=int, default=32, help="最多读取的WAV数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例至少重复的次数")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="每个用例至少累计的计时时长")
+    parser.add_argument("--filter", help="只运行名称匹配此正则的用例")
+    parser.add_argument("--output", help="把结果追加到此JSON Lines文件，并与上一次结果对比")
+    args = parser.parse_args()
+
+    # 被测函数自身的日志（如出错信息）不计入结果
+    logging.getLogger("assistant").setLevel(logging.WARNING)
+
+    audio_corpus = load_audio_corpus(args.audio_dir, args.max_audio_files)
+    english, chinese, user = load_text_corpus(args.db)
+    audio_seconds = sum(len(audio) / sample_rate for audio, sample_rate in audio_corpus)
+    logger.info(f"语料: {len(audio_corpus)}个WAV（{audio_seconds:.1f}秒），"
+                f"{len(english)}条英文、{len(chinese)}条中文回复，{len(user)}条用户输入")
+
+    cases = build_cases(audio_corpus, english, chinese, user)
+    if args.filter:
+        cases = {name: case for name, case in cases.items() if re.search(args.filter, name)}
+
+    results = {}
+    for name, (function, items) in cases.items():
+        timings = measure(function, args.repeat, args.min_seconds)
+        best = min(timings)
+        results[name] = {
+            "items": items,
+            "runs": len(timings),
+            "min_ms": best * 1000,
+            "median_ms": statistics.median(timings) * 1000,
+            "per_item_us": best / max(items, 1) * 1e6
+        }
+
+    revision = None
+    if args.output:
+        record = append_result(args.output, {
+            "benchmark": "microbench",
+            "corpus": {"audio_files": len(audio_corpus), "audio_seconds": audio_seconds,
+                       "english": len(english), "chinese": len(chinese), "user": len(user)},
+            "cases": results
+        })
+        revision = record["revision"]
+    baseline_revision, baseline = previous_results(args.output, revision)
+
+    header = f"{'case':<36}{'items':>6}{'min ms':>12}{'median ms':>12}{'per item us':>12}"
+    if baseline:
+        header += f"{'vs ' + baseline_revision:>18}"
+    print("\n" + header)
+    for name, result in results.items():
+        line = (f"{name:<36}{result['items']:>6}{result['min_ms']:>12.2f}"
+                f"{result['median_ms']:>12.2f}{result['per_item_us']:>12.1f}")
+        if name in baseline:
+            line += f"{baseline[name]['min_ms'] / result['min_ms']:>17.2f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
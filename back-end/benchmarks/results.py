@@ -0,0 +1,56 @@
+"""
+基准测试结果记录
+- 结果以JSON Lines格式追加到文件，每条带时间和当前提交，便于不同提交之间对比
+"""
+import json
+import logging
+import os
+import subprocess
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+
+def git_revision():
+    """当前提交的短哈希，工作区有改动时加上-dirty"""
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD", "--", "."], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).returncode != 0
+        return f"{revision}-dirty" if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_result(path, record):
+    """把一条结果追加到JSON Lines文件"""
+    record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": git_revision(), **record}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    logger.info(f"结果已追加到: {path}")
+    return record
+
+
+def load_results(path, benchmark):
+    """读取文件中某个基准测试的全部历史结果，文件不存在时返回空列表"""
+    if not path or not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"跳过无法解析的结果行: {line[:80]}")
+                continue
+            if record.get("benchmark") == benchmark:
+                records.append(record)
+    return records
@@ -0,0 +1,63 @@
+"""
+在基准测试环境中启动FastAPI应用
+- 在独立的工作目录中运行（数据库、音频文件都写到这里，不影响正式数据）
+- 把Ollama/TTS/Whisper地址指向替身后端
+- 可用 --set KEY=VALUE 覆盖config中的其他配置（VALUE按JSON解析，解析失败时按字符串处理）
+
+示例: python benchmarks/serve_app.py --backend http://127.0.0.1:9911 --set MAX_ACTIVE_PIPELINES=8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def parse_override(item):
+    """解析 KEY=VALUE 形式的配置覆盖"""
+    key, _, value = item.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在替身后端上启动应用")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9912)
+    parser.add_argument("--backend", default="http://127.0.0.1:9911", help="替身后端地址")
+    parser.add_argument("--workdir", required=True, help="应用的工作目录")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖config配置")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import config
+    config.OLLAMA_API_URL = args.backend
+    config.TTS_API_URL = args.backend
+    config.WHISPER_API_URL = f"{args.backend}/transcribe/"
+    for item in args.set:
+        key, value = parse_override(item)
+        if not hasattr(config, key):
+            parser.error(f"未知配置项: {key}")
+        setattr(config, key, value)
+        logger.info(f"config.{key} = {value!r}")
+
+    import uvicorn
+    import main as app_main
+    uvicorn.run(app_main.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
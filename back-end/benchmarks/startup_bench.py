@@ -0,0 +1,178 @@
+"""
+启动耗时基准测试
+- 在全新进程中测量 import main 的耗时（python -X importtime），并按顶层包汇总
+- 检查只在首次使用时才需要的模块（声卡、音频解码、scipy等）没有在导入时被加载
+- 启动应用进程，测量开始接受请求（/healthz）和就绪（/readyz）所需的时间
+- 导入耗时中位数超过 --budget-ms 或有延迟模块被提前加载时，以非零状态退出
+
+示例: python -m benchmarks.startup_bench --runs 5 --output startup.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from aiohttp import web
+from benchmarks import stub_backends
+from benchmarks.results import append_result
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 服务端导入main时不应加载的模块：只有本地麦克风模式、语音输入或离线工具才需要
+DEFERRED_MODULES = ["sounddevice", "pydub", "scipy", "requests"]
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def subprocess_env():
+    """子进程环境：能从任意工作目录导入后端模块"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def parse_importtime(output):
+    """解析 -X importtime 输出，返回 (main的累计耗时us, 按顶层包汇总的自身耗时us)"""
+    total = None
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == "main":
+            total = int(cumulative_us)
+    return total, packages
+
+
+def measure_import(workdir):
+    """在新进程中导入main，返回 (耗时us, 按包汇总的耗时, 提前加载的延迟模块)"""
+    code = (
+        "import sys, json; import main; "
+        f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=workdir, env=subprocess_env(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入main失败:\n{result.stderr[-2000:]}")
+    total, packages = parse_importtime(result.stderr)
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return total, packages, loaded
+
+
+async def measure_server_start(workdir, app_port, stub_port):
+    """启动应用进程，返回 (到/healthz可访问的秒数, 到/readyz返回200的秒数)"""
+    settings = stub_backends.add_arguments(argparse.ArgumentParser()).parse_args([])
+    runner = web.AppRunner(stub_backends.create_app(settings), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", stub_port).start()
+
+    command = [
+        sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "serve_app.py"),
+        "--port", str(app_port), "--backend", f"http://127.0.0.1:{stub_port}", "--workdir", workdir
+    ]
+    log = open(os.path.join(workdir, "app.log"), "w")
+    start = time.monotonic()
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=subprocess_env())
+    live = ready = None
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+            while ready is None and time.monotonic() - start < 60:
+                if process.poll() is not None:
+                    raise RuntimeError(f"应用进程已退出，请查看{log.name}")
+                path = "/healthz" if live is None else "/readyz"
+                try:
+                    async with session.get(f"http://127.0.0.1:{app_port}{path}") as response:
+                        if live is None:
+                            live = time.monotonic() - start
+                        elif response.status == 200:
+                            ready = time.monotonic() - start
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        await runner.cleanup()
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数，取中位数")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="import main耗时中位数的上限")
+    parser.add_argument("--top", type=int, default=12, help="显示耗时最多的前N个包")
+    parser.add_argument("--skip-server", action="store_true", help="只测量导入耗时，不启动应用")
+    parser.add_argument("--app-port", type=int, default=9912)
+    parser.add_argument("--stub-port", type=int, default=9911)
+    parser.add_argument("--output", help="把结果追加到此JSON Lines文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="weebo-startup-")
+    totals, package_runs, loaded = [], [], set()
+    for _ in range(args.runs):
+        total, packages, deferred_loaded = measure_import(workdir)
+        totals.append(total / 1000)
+        package_runs.append(packages)
+        loaded.update(deferred_loaded)
+
+    names = set().union(*package_runs)
+    packages = {name: statistics.median(run.get(name, 0) for run in package_runs) / 1000 for name in names}
+    import_ms = statistics.median(totals)
+
+    live_times, ready_times = [], []
+    if not args.skip_server:
+        for _ in range(args.runs):
+            live, ready = asyncio.run(measure_server_start(workdir, args.app_port, args.stub_port))
+            live_times.append(live)
+            ready_times.append(ready)
+
+    print(f"\nimport main: 中位数 {import_ms:.0f} ms（最小 {min(totals):.0f} ms，{args.runs}次）  预算 {args.budget_ms:.0f} ms")
+    print("耗时最多的包（自身耗时之和，ms）:")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<24}{ms:>8.1f}")
+    if live_times:
+        print(f"开始接受请求(/healthz): 中位数 {statistics.median(live_times) * 1000:.0f} ms")
+        if all(ready_times):
+            print(f"就绪(/readyz): 中位数 {statistics.median(ready_times) * 1000:.0f} ms")
+        else:
+            print("就绪(/readyz): 60秒内未就绪")
+    if loaded:
+        print(f"导入时提前加载了应延迟的模块: {', '.join(sorted(loaded))}")
+
+    if args.output:
+        append_result(args.output, {
+            "benchmark": "startup",
+            "import_ms": import_ms,
+            "import_runs_ms": totals,
+            "packages_ms": dict(sorted(packages.items(), key=lambda item: -item[1])[:args.top]),
+            "live_ms": statistics.median(live_times) * 1000 if live_times else None,
+            "ready_ms": statistics.median(ready_times) * 1000 if live_times and all(ready_times) else None,
+            "deferred_modules_loaded": sorted(loaded)
+        })
+
+    within_budget = import_ms <= args.budget_ms
+    print("结果: " + ("通过" if within_budget and not loaded else "未通过"))
+    sys.exit(0 if within_budget and not loaded else 1)
+
+
+if __name__ == "__main__":
+    main()
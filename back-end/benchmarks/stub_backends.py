@@ -0,0 +1,148 @@
+"""
+本地后端替身：模拟Ollama、TTS服务器和Whisper服务器，供负载测试使用
+- Ollama: /api/tags, /api/chat（支持stream），可配置首token延迟和token速率
+- TTS: /tts，可配置单次调用开销、合成速度和生成音频的长度
+- Whisper: /transcribe/，可配置转写延迟
+
+单独运行: python -m benchmarks.stub_backends --port 9911
+"""
+import argparse
+import asyncio
+import io
+import json
+import wave
+import numpy as np
+from aiohttp import web
+
+REPLY_SENTENCES = [
+    "Hello there, my dear!",
+    "It is lovely to hear from you today.",
+    "How was your day at work?",
+    "I hope nothing too stressful happened, and that you found a moment to rest.",
+    "Tell me everything, I am all ears.",
+    "Remember that I am always here for you, whenever you need someone to talk to.",
+]
+
+TRANSLATION = "你好，亲爱的！今天能收到你的消息真好。"
+SUMMARY = "The user has been chatting with the assistant about their day."
+
+
+def add_arguments(parser):
+    """添加替身后端的参数（负载测试脚本复用）"""
+    group = parser.add_argument_group("stub backends")
+    group.add_argument("--llm-first-token-ms", type=float, default=300, help="LLM首个token的延迟")
+    group.add_argument("--llm-tokens-per-second", type=float, default=40, help="LLM流式输出速率")
+    group.add_argument("--llm-sentences", type=int, default=4, help="每条回复的句子数")
+    group.add_argument("--translation-ms", type=float, default=400, help="翻译请求延迟")
+    group.add_argument("--tts-overhead-ms", type=float, default=300, help="每次TTS调用的固定开销")
+    group.add_argument("--tts-chars-per-second", type=float, default=60, help="TTS合成速度（字符/秒）")
+    group.add_argument("--tts-audio-seconds-per-char", type=float, default=0.06, help="每个字符生成的音频时长")
+    group.add_argument("--tts-sample-rate", type=int, default=24000, help="TTS输出采样率")
+    group.add_argument("--tts-concurrency", type=int, default=2, help="TTS服务器同时处理的请求数（模拟单GPU）")
+    group.add_argument("--stt-ms", type=float, default=250, help="Whisper转写延迟")
+    return parser
+
+
+def reply_text(number, sentences):
+    """生成英文回复；首句带编号，避免TTS缓存和请求合并掩盖真实的合成负载"""
+    body = [REPLY_SENTENCES[i % len(REPLY_SENTENCES)] for i in range(max(1, sentences) - 1)]
+    return " ".join([f"This is reply number {number}."] + body)
+
+
+def make_wav(duration, sample_rate):
+    """生成指定时长的16bit单声道WAV"""
+    samples = int(duration * sample_rate)
+    tone = (np.sin(np.arange(samples) * 2 * np.pi * 220 / sample_rate) * 8000).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(tone.tobytes())
+    return buffer.getvalue()
+
+
+def create_app(settings):
+    """创建替身后端应用，settings为argparse解析结果"""
+    tts_slots = asyncio.Semaphore(max(1, settings.tts_concurrency))
+    stats = {"llm": 0, "translation": 0, "summary": 0, "tts": 0, "stt": 0, "max_prompt_chars": 0}
+
+    async def tags(request):
+        return web.json_response({"models": [{"name": "phi4:latest"}]})
+
+    async def chat(request):
+        body = await request.json()
+        system_prompt = body["messages"][0]["content"] if body.get("messages") else ""
+
+        # 翻译请求：非流式，固定延迟
+        if "translat" in system_prompt.lower():
+            stats["translation"] += 1
+            await asyncio.sleep(settings.translation_ms / 1000)
+            return web.json_response({"message": {"role": "assistant", "content": TRANSLATION}, "done": True})
+
+        # 摘要请求：非流式，与翻译相同的延迟
+        if "summar" in system_prompt.lower():
+            stats["summary"] += 1
+            await asyncio.sleep(settings.translation_ms / 1000)
+            return web.json_response({"message": {"role": "assistant", "content": SUMMARY}, "done": True})
+
+        # 记录对话请求的最大提示长度，用于检查历史记录是否受上下文窗口限制
+        prompt_chars = sum(len(message.get("content", "")) for message in body.get("messages", []))
+        stats["max_prompt_chars"] = max(stats["max_prompt_chars"], prompt_chars)
+        stats["llm"] += 1
+        text = reply_text(stats["llm"], settings.llm_sentences)
+        tokens = [token + " " for token in text.split(" ")]
+        token_interval = 1 / max(settings.llm_tokens_per_second, 1)
+
+        if not body.get("stream", True):
+            await asyncio.sleep(settings.llm_first_token_ms / 1000 + token_interval * len(tokens))
+            return web.json_response({"message": {"role": "assistant", "content": text}, "done": True})
+
+        response = web.StreamResponse()
+        response.content_type = "application/x-ndjson"
+        await response.prepare(request)
+        await asyncio.sleep(settings.llm_first_token_ms / 1000)
+        for token in tokens:
+            await response.write((json.dumps({"message": {"content": token}, "done": False}) + "\n").encode())
+            await asyncio.sleep(token_interval)
+        await response.write((json.dumps({"message": {"content": ""}, "done": True}) + "\n").encode())
+        return response
+
+    async def tts(request):
+        body = await request.json()
+        text = body.get("text", "")
+        stats["tts"] += 1
+        async with tts_slots:
+            await asyncio.sleep(settings.tts_overhead_ms / 1000 + len(text) / max(settings.tts_chars_per_second, 1))
+        duration = max(0.2, len(text) * settings.tts_audio_seconds_per_char)
+        return web.Response(body=make_wav(duration, settings.tts_sample_rate), content_type="audio/wav")
+
+    async def transcribe(request):
+        await request.post()
+        stats["stt"] += 1
+        await asyncio.sleep(settings.stt_ms / 1000)
+        return web.json_response({"text": "Hello, how are you doing today?"})
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/api/tags", tags)
+    app.router.add_post("/api/chat", chat)
+    app.router.add_post("/tts", tts)
+    app.router.add_post("/transcribe/", transcribe)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama/TTS/Whisper替身后端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9911)
+    add_arguments(parser)
+    settings = parser.parse_args()
+    web.run_app(create_app(settings), host=settings.host, port=settings.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,26 @@ SILENCE_DURATION = 2.5    # Duration of silence to end recording (seconds)
 MIN_SPEECH_DURATION = 1.0  # Minimum duration of speech to process
 NOISE_REDUCTION_THRESHOLD = 0.02  # Threshold for noise reduction
 MIN_VALID_AUDIO_LENGTH = 0.5  # Minimum valid audio length (seconds)
+MAX_UTTERANCE_SECONDS = 60  # Longest utterance buffered by /ws/voice; longer ones are rejected
+VOICE_SAMPLE_RATE_RANGE = (8000, 48000)  # Sample rates /ws/voice accepts for uploaded PCM
 
 # TTS settings
 TTS_MODE = "api"  # "local" or "api"
 TTS_API_URL = "http://192.168.31.80:8000"
 TTS_SPEAKER = "zonos_americanfemale"  # Voice model to use
+TTS_MAX_CONCURRENCY = 3  # Segments synthesized in parallel per /chat reply
+TTS_SERVER_CONCURRENCY = 4  # Requests in flight to the TTS server across all replies
+TTS_CACHE_ENABLED = True  # Cache synthesized audio by text, speaker and parameters
+TTS_CACHE_DIR = "tts_cache"
+TTS_CACHE_MEMORY_BYTES = 64 * 1024 * 1024  # In-memory LRU tier
+TTS_CACHE_DISK_BYTES = 1024 * 1024 * 1024  # On-disk tier, oldest files evicted first
+TTS_SEGMENT_FIRST_LENGTH = 80  # Characters in the first TTS segment of a reply (short for low time-to-first-audio)
+TTS_SEGMENT_GROWTH = 2.0  # Each later segment may be this much longer than the previous one
+TTS_SEGMENT_MAX_LENGTH = 250  # Upper bound on segment length
+TTS_ADAPTIVE_SEGMENTS = True  # Derive the sizes above from measured TTS throughput once enough calls are seen
+TTS_TARGET_FIRST_AUDIO_SECONDS = 1.0  # Synthesis time budget for the first segment when adapting
+STREAM_AUDIO_FORMAT = "opus"  # Default codec for streamed speech: "opus", "flac" or "wav"
+TTS_PRERENDER_SPEAKERS = [TTS_SPEAKER]  # Speakers whose canned/fallback replies are synthesized at startup
 
 # Local TTS settings
 MAX_PHONEME_LENGTH = 510
@@ -25,12 +40,37 @@ WHISPER_API_URL = "http://192.168.31.80:8001/transcribe/"
 OLLAMA_API_URL = "http://192.168.31.80:11434"
 # OLLAMA_MODEL = "llama3.2:latest"  # Change this to a model that exists on your server
 OLLAMA_MODEL = "phi4:latest" 
+LLM_POOL_SIZE = 16  # Max pooled keep-alive connections to Ollama
+LLM_MAX_CONCURRENCY = 4  # Requests in flight to Ollama (chat, stream and translation)
+LLM_STREAM_MODE = False  # Stream LLM tokens sentence by sentence into TTS in /chat
+DEFER_TRANSLATION = False  # Send the Chinese translation as a later "translation" event in /chat
+LLM_CONTEXT_TOKENS = 2048  # Estimated token budget for the prompt history: system prompt, summary and recent turns
+LLM_CONTEXT_TURNS = 8  # Most recent user/assistant exchanges sent verbatim when they fit the budget
+LLM_SUMMARY_ENABLED = True  # Fold turns that fall out of the window into a rolling summary in the background
+LLM_SUMMARY_TOKENS = 256  # Maximum length of that summary
 
 # Database settings
 DB_PATH = "chat_history.db"
+SESSION_CACHE_SIZE = 256  # Sessions whose history each worker keeps in memory; older ones are reloaded from the database
 
 # Processing settings
-MAX_THREADS = 1
+MAX_THREADS = 1  # Concurrent Whisper transcriptions (each runs on a worker thread)
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8080
+WORKERS = 1  # Server processes; history lives in the database, so every worker sees the same conversation
+MAX_ACTIVE_PIPELINES = 4  # /chat and /conversation requests processed at once, per worker
+MAX_QUEUED_PIPELINES = 16  # Requests waiting for a slot; beyond this they get 503
+PIPELINE_QUEUE_TIMEOUT = 30.0  # Seconds a request may wait for a slot before 503
+
+# Health check settings
+READINESS_REQUIRED_CHECKS = ["history", "database", "llm", "tts"]  # /readyz returns 503 unless these pass; whisper only affects voice input
+READINESS_TIMEOUT = 2.0  # Seconds each readiness check may take
+READINESS_CACHE_SECONDS = 2.0  # Reuse readiness results for this long between probes
+
+# Logging settings
+LOG_LEVEL = "INFO"  # DEBUG, INFO, WARNING or ERROR; debug() output is dropped above DEBUG
+LOG_FORMAT = "text"  # "text" or "json" (one object per line, for log shippers)
+LOG_COLOR = True  # ANSI colors in text logs
 
 # ANSI colors for terminal output
 PINK = '\033[95m'
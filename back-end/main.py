@@ -1,16 +1,26 @@
 """Main entry point for the assistant API server."""
 import signal
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form, Request, Body, BackgroundTasks
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form, Request, Body, BackgroundTasks, Path, Query
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import config
-from utils.logging_utils import debug, info, error, user_message, assistant_message
+from utils.logging_utils import debug, info, error, user_message, assistant_message, new_request_id
+from utils.audio_utils import resample_audio, negotiate_audio_format, encode_audio, transcode_audio, AUDIO_FORMATS
+from utils.audio_writer import MergedAudioWriter, submit_file_write
 from services.audio_service import AudioService
 from services.llm_service import LLMService
 from services.database_service import DatabaseService
+from services.conversation_context import ConversationContext
+from services.conversation_store import ConversationStore
+from models.database_models import DEFAULT_SESSION_ID
+from services.admission import AdmissionController, AdmissionRejected
+from services.health import ReadinessChecker
+from services import metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+from resources.responses import PROCESSING_ERROR, REQUEST_ERROR, fallback_response, canned_english_texts
 from models.stt_model import SpeechToTextModel
 from models.tts_model import TextToSpeechModel
 import re
@@ -20,28 +30,38 @@ import base64
 import numpy as np
 import soundfile as sf
 import io
-from pydub import AudioSegment
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 import aiohttp
 import uuid
 import os
 import hashlib
+import tempfile
 from datetime import datetime
-import sqlite3
 import wave
+from email.utils import parsedate_to_datetime
+import struct
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 
-# 设置日志
-logging.basicConfig(level=logging.INFO)
+# 设置日志（由utils.logging_utils统一配置为后台线程异步输出）
 logger = logging.getLogger(__name__)
 
 # 在配置部分添加音频存储路径
 AUDIO_STORAGE_DIR = "audio_cache"
 os.makedirs(AUDIO_STORAGE_DIR, exist_ok=True)
 
+# /chat二进制流格式：客户端通过Accept头协商
+# 每帧为 [4字节头长度][4字节负载长度][JSON头][原始音频字节]，长度均为大端无符号整数
+BINARY_STREAM_MEDIA_TYPE = "application/vnd.weebo.frames"
+
+# 会话ID：字母、数字、下划线、点和连字符，最长100个字符（与数据库列长度一致）
+SESSION_ID_PATTERN = r"^[\w.-]{1,100}$"
+
 class ConversationRequest(BaseModel):
     message: str
     mode: str  # 'text' or 'voice'
-    session_id: Optional[str] = None
+    session_id: Optional[str] = Field(None, pattern=SESSION_ID_PATTERN)
     speaker: Optional[str] = 'default'  # 添加 speaker 字段
 
 class Assistant:
@@ -52,45 +72,56 @@ class Assistant:
         # Create shutdown event for graceful termination
         self.shutdown_event = asyncio.Event()
         
-        # Initialize services
+        # Initialize services（不访问网络和数据库，进程可立即开始接受请求）
         self.audio_service = AudioService(self.shutdown_event)
         self.llm_service = LLMService()
         self.db_service = DatabaseService("data/messages.db")
         self.stt_model = SpeechToTextModel()
         self.tts_model = TextToSpeechModel()
         
-        # Load conversation history
-        messages = self.db_service.load_session()
-        if messages:
-            self.llm_service.set_messages(messages)
-
-    def split_into_chunks(self, text, max_length=150):
-        """Split text into chunks at sentence boundaries."""
-        if not text:
-            return []
-            
-        # Split at sentence boundaries
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) <= max_length:
-                current_chunk += " " + sentence if current_chunk else sentence
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence
+        # 各会话的历史记录保存在数据库中，各工作进程通过ConversationStore读取，
+        # 本进程只缓存最近使用的会话（LRU），未缓存的会话按索引从数据库加载
+        # 发送给LLM的历史记录限制在token预算内，移出窗口的较早轮次由后台任务压缩为摘要
+        self.conversation_store = ConversationStore(
+            self.db_service,
+            summarize=self.llm_service.summarize if config.LLM_SUMMARY_ENABLED else None
+        )
         
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+        # 默认会话：speaker和转写上下文等进程内状态
+        self.conversation = ConversationContext(
+            session_id=DEFAULT_SESSION_ID,
+            transcripts=self.stt_model.previous_transcripts
+        )
+    
+    async def start(self):
+        """启动阶段：同步历史记录并探测Ollama中可用的模型，在后台执行"""
+        discovery = asyncio.create_task(self.llm_service.discover_models())
+        try:
+            rows = await self.conversation_store.refresh(DEFAULT_SESSION_ID)
+            info(f"已加载默认会话的{rows}条历史消息")
+        except Exception as e:
+            error(f"加载历史记录失败: {e}")
+        await discovery
+    
+    async def ready_context(self, speaker=None, session_id=None, transcripts=None):
+        """从数据库同步会话最新的历史记录（包括其他工作进程写入的），创建请求上下文
         
-        return chunks
+        未指定session_id时使用默认会话。
+        """
+        session_id = session_id or DEFAULT_SESSION_ID
+        messages = await self.conversation_store.history(session_id)
+        if transcripts is None:
+            transcripts = self.conversation_store.transcripts(session_id)
+        return self.new_context(speaker, session_id, transcripts, messages)
 
-    async def process_text_input(self, user_input: str, session_id: Optional[str] = None, speaker: str = 'default'):
+    def new_context(self, speaker=None, session_id=None, transcripts=None, messages=None):
+        """为单个请求创建上下文，speaker等请求级状态不再写入共享的模型对象"""
+        return self.conversation.for_request(speaker, transcripts, messages, session_id)
+
+    async def process_text_input(self, user_input: str, session_id: Optional[str] = None, speaker: str = 'default', context: Optional[ConversationContext] = None):
         """Process text input and return response."""
         try:
+            context = context or await self.ready_context(speaker, session_id)
             debug(f"Processing text input: {user_input}")
             debug(f"Session ID: {session_id}")
             debug(f"Speaker: {speaker}")
@@ -103,11 +134,11 @@ class Assistant:
             user_message(user_input)
             
             # Save user message
-            self.db_service.save_message("user", user_input)
+            await asyncio.to_thread(self.db_service.save_message, "user", user_input, session_id=context.session_id)
             
             # Get response from LLM
             debug("Requesting response from LLM service")
-            response_data = self.llm_service.get_response(user_input)
+            response_data = await self.llm_service.get_response(user_input, context.messages)
             debug(f"LLM response data: {response_data}")
             
             if not response_data:
@@ -117,19 +148,11 @@ class Assistant:
             # 确保 response_data 包含必要字段
             if not isinstance(response_data, dict):
                 error(f"Invalid response format: {type(response_data)}")
-                return {
-                    "english": "I'm sorry, I encountered an error while processing your request.",
-                    "chinese": "抱歉，处理您的请求时遇到错误。",
-                    "display": "I'm sorry, I encountered an error while processing your request.\n\n抱歉，处理您的请求时遇到错误。"
-                }
+                return fallback_response(PROCESSING_ERROR)
             
             if 'english' not in response_data or 'chinese' not in response_data:
                 error(f"Missing required fields in response: {response_data.keys()}")
-                return {
-                    "english": "I'm sorry, I encountered an error while processing your request.",
-                    "chinese": "抱歉，处理您的请求时遇到错误。",
-                    "display": "I'm sorry, I encountered an error while processing your request.\n\n抱歉，处理您的请求时遇到错误。"
-                }
+                return fallback_response(PROCESSING_ERROR)
             
             debug("Successfully processed LLM response")
             debug(f"English content: {response_data['english']}")
@@ -144,11 +167,10 @@ class Assistant:
             assistant_message(display_message)
             
             # Save assistant message
-            self.db_service.save_message("assistant", display_message)
+            await asyncio.to_thread(self.db_service.save_message, "assistant", display_message, session_id=context.session_id)
             
             # Generate audio with selected speaker
-            self.tts_model.set_speaker(speaker)  # 设置 speaker
-            audio_data = await self.tts_model.generate_audio_async(response_data["english"])
+            audio_data = await self.tts_model.generate_audio_async(response_data["english"], context.speaker)
             
             # 确保音频数据是可序列化的格式
             if isinstance(audio_data, tuple):
@@ -171,18 +193,16 @@ class Assistant:
             error(f"Error in text processing: {e}")
             import traceback
             debug(f"Exception details: {traceback.format_exc()}")
-            error_response = {
-                "english": "I'm sorry, I encountered an error while processing your request.",
-                "chinese": "抱歉，处理您的请求时遇到错误。",
-                "display": "I'm sorry, I encountered an error while processing your request.\n\n抱歉，处理您的请求时遇到错误。"
-            }
-            return error_response
+            return fallback_response(PROCESSING_ERROR)
 
-    async def process_voice_input(self, audio_data: bytes, sample_rate: int = 16000, speaker: str = 'default'):
+    async def process_voice_input(self, audio_data: bytes, sample_rate: int = 16000, speaker: str = 'default', session_id: Optional[str] = None):
         """Process voice input and return response."""
         try:
-            # 尝试使用pydub处理音频
+            context = await self.ready_context(speaker, session_id)
+            
+            # 尝试使用pydub处理音频（只有语音输入需要，首次使用时才导入）
             import io
+            from pydub import AudioSegment
             
             # 将bytes转换为AudioSegment
             audio = AudioSegment.from_file(io.BytesIO(audio_data))
@@ -198,7 +218,7 @@ class Assistant:
             processed_audio = self.audio_service.preprocess_audio(samples, sample_rate)
             
             # Transcribe
-            transcript = self.stt_model.transcribe(processed_audio)
+            transcript = await self.stt_model.transcribe_async(processed_audio, context.transcripts)
             if not transcript:
                 return {"error": "No speech detected"}
             
@@ -206,7 +226,7 @@ class Assistant:
             user_message(transcript)
             
             # Get response using text processing
-            return await self.process_text_input(transcript, speaker=speaker)
+            return await self.process_text_input(transcript, context=context)
             
         except Exception as e:
             error(f"Error in voice processing: {e}")
@@ -235,10 +255,10 @@ class Assistant:
             except Exception:
                 return None
 
-    def save_message_with_audio(self, role, content, message_id, audio_paths=None):
+    def save_message_with_audio(self, role, content, message_id, audio_paths=None, session_id=DEFAULT_SESSION_ID):
         """保存消息并关联音频路径"""
         try:
-            return self.db_service.save_message_with_audio(role, content, message_id, audio_paths)
+            return self.db_service.save_message_with_audio(role, content, message_id, audio_paths, session_id)
         except Exception as e:
             error(f"保存消息(带音频路径)失败: {e}")
             import traceback
@@ -290,8 +310,26 @@ class Assistant:
             logging.error(traceback.format_exc())
             return 0
 
+@asynccontextmanager
+async def lifespan(app):
+    """启动时在后台加载历史记录、探测Ollama模型，再预渲染固定回复（错误提示等）的音频，不阻塞服务启动；
+    关闭时取消后台摘要任务并释放连接池"""
+    async def startup():
+        await assistant.start()
+        # 模型探测完成后再渲染，错误提示中的模型名与实际使用的一致
+        texts = canned_english_texts(model=assistant.llm_service.model)
+        await assistant.tts_model.prerender(texts, config.TTS_PRERENDER_SPEAKERS)
+    
+    app.state.startup_task = asyncio.create_task(startup())
+    yield
+    
+    assistant.conversation_store.close()
+    await assistant.llm_service.close()
+    await readiness.close()
+    metrics.mark_process_dead(os.getpid())
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 更新 CORS 配置，明确指定允许的域名
 app.add_middleware(
@@ -326,6 +364,32 @@ app.add_middleware(
 # Initialize assistant
 assistant = Assistant()
 
+# 准入控制：限制同时运行的/chat和/conversation管线数，排队已满时快速返回503
+admission = AdmissionController()
+
+# TTS缓存命中统计随/metrics一起导出
+metrics.register_tts_cache(assistant.tts_model.cache)
+
+# 就绪检查：历史记录能否从数据库同步，Ollama、TTS、Whisper服务是否可用
+readiness = ReadinessChecker()
+
+async def check_history():
+    # 检查默认会话的历史记录能否读取；不改变会话缓存的LRU顺序和命中统计，也不新建缓存条目
+    await assistant.conversation_store.probe(DEFAULT_SESSION_ID)
+    return assistant.conversation_store.stats()
+
+async def check_database():
+    await asyncio.to_thread(assistant.db_service.ping)
+
+readiness.add("history", check_history)
+readiness.add("database", check_database)
+readiness.add_http("llm", f"{assistant.llm_service.api_url}/api/tags")
+readiness.add_http("tts", assistant.tts_model.api_url)
+readiness.add_http("whisper", assistant.stt_model.api_url)
+
+# 进程启动时间，用于/healthz
+STARTED_AT = time.monotonic()
+
 # 定义请求模型
 class TextMessageRequest(BaseModel):
     message: str
@@ -351,29 +415,74 @@ class ChatRequest(BaseModel):
     message: str
     speaker: str = "default"
     stream_audio: bool = True  # 是否需要流式音频
+    stream_text: Optional[bool] = None  # 是否逐句流式生成文本，默认使用config.LLM_STREAM_MODE
+    defer_translation: Optional[bool] = None  # 翻译是否在音频之后以translation事件返回，默认使用config.DEFER_TRANSLATION
+    audio_format: Optional[str] = None  # 音频编码：opus、flac或wav，默认使用config.STREAM_AUDIO_FORMAT
+    session_id: Optional[str] = Field(None, pattern=SESSION_ID_PATTERN)  # 所属会话，默认使用默认会话
 
 # 添加缺失的 /get_audio 端点
 class GetAudioRequest(BaseModel):
     message_id: str
+    audio_format: Optional[str] = "wav"  # 返回的音频编码：wav、opus或flac
+
+def overloaded_response(rejection: AdmissionRejected):
+    """排队已满或等待超时时返回503，并告知客户端何时重试"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(rejection.retry_after)},
+        content={
+            "error": f"服务繁忙（{rejection.reason}），请稍后再试",
+            "retry_after": rejection.retry_after
+        }
+    )
+
+def release_with_response(release, response):
+    """流式响应在流结束后调用release释放管线槽位，其他响应立即释放"""
+    if not isinstance(response, StreamingResponse):
+        release()
+        return response
+    
+    body_iterator = response.body_iterator
+    
+    async def release_when_done():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            release()
+    
+    response.body_iterator = release_when_done()
+    return response
 
 @app.post("/conversation")
 async def conversation(
     file: UploadFile = File(...),
     sample_rate: Optional[int] = Form(16000),
-    speaker: Optional[str] = Form('default')
+    speaker: Optional[str] = Form('default'),
+    session_id: Optional[str] = Form(None, pattern=SESSION_ID_PATTERN)
 ):
     """Handle conversation requests."""
+    try:
+        ticket = await admission.acquire()
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    
+    in_flight = metrics.IN_FLIGHT_REQUESTS.labels(endpoint="conversation")
+    in_flight.inc()
     try:
         # 读取音频文件
         audio_data = await file.read()
         
         # 处理音频数据
-        response = await assistant.process_voice_input(audio_data, sample_rate, speaker)
+        response = await assistant.process_voice_input(audio_data, sample_rate, speaker, session_id)
         return response
         
     except Exception as e:
         error(f"Conversation error: {e}")
         return {"error": str(e)}
+    finally:
+        in_flight.dec()
+        ticket.release()
 
 # @app.post("/api/send_message")
 # async def send_message(request: TextMessageRequest):
@@ -408,8 +517,28 @@ async def conversation(
 
 @app.get("/sessions")
 async def get_sessions():
-    """Get all conversation sessions."""
-    return assistant.db_service.get_session_history()
+    """列出所有会话，最近活跃的在前"""
+    sessions = await asyncio.to_thread(assistant.db_service.list_sessions)
+    return {"sessions": sessions}
+
+@app.get("/sessions/{session_id}/messages")
+async def get_session_messages(
+    session_id: str = Path(..., pattern=SESSION_ID_PATTERN),
+    limit: Optional[int] = Query(None, ge=1, le=1000)
+):
+    """获取一个会话的消息，limit指定时只返回最近的limit条"""
+    messages = await asyncio.to_thread(assistant.db_service.get_session_messages, session_id, limit)
+    return {"session_id": session_id, "messages": messages}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str = Path(..., pattern=SESSION_ID_PATTERN)):
+    """删除一个会话的所有消息"""
+    deleted = await asyncio.to_thread(assistant.db_service.clear_session, session_id)
+    if deleted is None:
+        raise HTTPException(status_code=500, detail="删除会话失败")
+    # 本进程立即丢弃缓存；其他工作进程的缓存在该会话下次被淘汰前仍保留已读取的消息
+    assistant.conversation_store.invalidate(session_id)
+    return {"session_id": session_id, "deleted": deleted}
 
 # 添加流式TTS端点
 # @app.post("/stream_tts")
@@ -483,21 +612,71 @@ async def get_sessions():
 #         return {"error": str(e)}
 
 @app.post("/chat")
-async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks, http_request: Request):
     """处理聊天请求，先返回文本，再流式返回TTS音频"""
+    received = time.monotonic()
+    try:
+        ticket = await admission.acquire()
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    
+    in_flight = metrics.IN_FLIGHT_REQUESTS.labels(endpoint="chat")
+    in_flight.inc()
+    
+    def release():
+        in_flight.dec()
+        ticket.release()
+    
+    try:
+        response = await process_chat(request, http_request, received)
+    except BaseException:
+        release()
+        raise
+    return release_with_response(release, response)
+
+async def process_chat(request: ChatRequest, http_request: Request, received=None):
+    """/chat的实际处理逻辑，在获得管线槽位后执行；received为收到请求的时间，用于统计首段音频延迟"""
+    received = received or time.monotonic()
     try:
+        # 请求级上下文，并发请求互不影响speaker
+        context = await assistant.ready_context(request.speaker, request.session_id)
+        
+        # 客户端声明接受二进制帧时，音频以原始字节传输，不再base64编码
+        binary = BINARY_STREAM_MEDIA_TYPE in http_request.headers.get("accept", "")
+        media_type = BINARY_STREAM_MEDIA_TYPE if binary else "application/x-ndjson"
+        audio_format = negotiate_audio_format(request.audio_format, config.STREAM_AUDIO_FORMAT)
+        
         # 记录用户消息
         user_message(request.message)
         
         # 保存用户消息
-        assistant.db_service.save_message("user", request.message)
+        await asyncio.to_thread(assistant.db_service.save_message, "user", request.message, session_id=context.session_id)
+        
+        # 流式模式：LLM逐句输出，每句立即送入TTS
+        stream_text = config.LLM_STREAM_MODE if request.stream_text is None else request.stream_text
+        if stream_text and request.stream_audio:
+            return StreamingResponse(
+                stream_until_disconnect(http_request, generate_pipelined_stream(request.message, context, binary, audio_format, received)),
+                media_type=media_type
+            )
         
-        # 获取LLM响应
-        response_data = assistant.llm_service.get_response(request.message)
+        # 延迟翻译模式：英文文本和音频立即返回，翻译并发进行（仅流式音频时有效）
+        defer_translation = config.DEFER_TRANSLATION if request.defer_translation is None else request.defer_translation
+        defer_translation = defer_translation and request.stream_audio
+        
+        # 获取LLM响应（客户端断开时中止Ollama请求）
+        response_data = await run_unless_disconnected(
+            http_request,
+            assistant.llm_service.get_response(request.message, context.messages, translate=not defer_translation)
+        )
         
         if not response_data:
             return {"error": "无法从LLM获取响应"}
         
+        translation_task = None
+        if defer_translation:
+            translation_task = asyncio.create_task(assistant.llm_service.translate(response_data["english"]))
+        
         # 显示助手消息
         display_message = {
             "english": response_data["english"],
@@ -506,7 +685,9 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
         assistant_message(display_message)
         
         # 保存助手回复
-        assistant_message_id = assistant.db_service.save_message("assistant", display_message)
+        assistant_message_id = await asyncio.to_thread(
+            assistant.db_service.save_message, "assistant", display_message, session_id=context.session_id
+        )
         debug(f"已保存助手消息，ID: {assistant_message_id}")
         
         # 如果不需要音频，直接返回文本响应
@@ -519,13 +700,16 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
             }
         
         # 分割文本为段落（仅对英文文本处理，因为TTS通常使用英文文本）
-        text_segments = split_text_into_segments(response_data["english"])
+        # 首段较短以尽快返回第一段音频，后续段落逐渐加长以减少TTS调用次数；预渲染过的固定回复不分割
+        text_segments = assistant.tts_model.split(response_data["english"], context.speaker)
         total_segments = len(text_segments)
         
         debug(f"文本分为{total_segments}个段落用于TTS处理")
         
         # 创建流式响应生成器
         async def generate_response_stream(text_segments: list[str]):
+            nonlocal translation_task
+            
             # 直接返回文本响应
             text_response = {
                 "type": "text",
@@ -536,132 +720,67 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
                 },
                 "text": display_message
             }
-            yield json.dumps(text_response) + "\n"
+            yield format_stream_event(text_response, binary)
             
-            # 设置TTS的speaker
-            assistant.tts_model.set_speaker(request.speaker)
+            async def translation_event():
+                # 翻译完成后补写数据库中的消息内容
+                display_message["chinese"] = await translation_task
+                await asyncio.to_thread(
+                    assistant.db_service.update_message_content, assistant_message_id, display_message
+                )
+                return {
+                    "type": "translation",
+                    "message_id": assistant_message_id,
+                    "chinese": display_message["chinese"],
+                    "content": display_message
+                }
             
-            # 准备存储音频段落路径的列表
+            # 准备存储音频段落路径的列表，音频边生成边追加到合并文件
             audio_paths = []
+            merged_writer = create_merged_writer(assistant_message_id)
             
-            # 逐段处理音频
-            for i, segment in enumerate(text_segments):
-                try:
-                    # 生成音频
-                    audio_response = await assistant.tts_model.generate_audio_segment(segment)
-                    
-                    if audio_response:
-                        audio_data, sample_rate = audio_response
-                        
-                        # 修复点：移除冗余的缩放转换
-                        wav_buffer = io.BytesIO()
-                        with wave.open(wav_buffer, 'wb') as wave_file:
-                            wave_file.setnchannels(1)
-                            wave_file.setframerate(sample_rate)
-                            wave_file.setsampwidth(2)
-                            
-                            # 改进验证逻辑
-                            if isinstance(audio_data, np.ndarray):
-                                # 自动处理数据类型转换
-                                if audio_data.dtype == np.float32:
-                                    # 浮点型需要先归一化再转int16
-                                    audio_data = np.clip(audio_data, -1.0, 1.0)
-                                    audio_data = (audio_data * 32767).astype(np.int16)
-                                elif audio_data.dtype != np.int16:
-                                    raise ValueError(f"不支持的音频数据类型: {audio_data.dtype}")
-                                    
-                                audio_bytes = audio_data.tobytes()
-                            else:
-                                raise ValueError("音频数据必须为numpy数组")
-
-                            wave_file.writeframes(audio_bytes)
-                        
-                        wav_bytes = wav_buffer.getvalue()
-                        base64_audio_data = base64.b64encode(wav_bytes).decode('utf-8')
-                        
-                        # 保存文件时增加校验
-                        if len(wav_bytes) < 100:  # WAV文件头至少44字节
-                            error(f"生成的音频文件过小: {len(wav_bytes)}字节")
-                            continue
-                        
-                        segment_filename = f"{assistant_message_id}_{i}.wav"
-                        segment_path = os.path.join(AUDIO_STORAGE_DIR, segment_filename)
-                        
-                        with open(segment_path, "wb") as f:
-                            f.write(wav_bytes)
-                        
-                        # 添加文件验证
-                        try:
-                            with wave.open(segment_path) as test_file:
-                                if test_file.getnframes() == 0:
-                                    error("保存的音频文件帧数为空")
-                        except Exception as e:
-                            error(f"音频文件校验失败: {e}")
-                        
-                        audio_paths.append({
-                            "segment_index": i,
-                            "path": segment_filename,
-                            "sample_rate": sample_rate
-                        }) 
-                        
-                        # 返回音频段落
-                        segment_response = {
-                            "type": "audio",
-                            "message_id": assistant_message_id,
-                            "segment_index": i,
-                            "total_segments": total_segments,
-                            "audio_data": base64_audio_data,  # 使用WAV格式的Base64数据
-                            "format": "wav",
-                            "sample_rate": sample_rate,
-                            "english": display_message["english"],
-                            "chinese": display_message["chinese"]
-                        }
-                        yield json.dumps(segment_response) + "\n"  # 返回JSON字符串，不是JSONResponse对象
-                        
-                except Exception as e:
-                    error(f"处理音频段落{i}时出错: {e}")
-                    import traceback
-                    error(traceback.format_exc())
-                    # 继续处理下一个段落，不中断
+            segment_queue = asyncio.Queue()
+            for item in enumerate(text_segments):
+                segment_queue.put_nowait(item)
+            segment_queue.put_nowait(None)
             
-            print(f"audio_paths: {audio_paths}")
-            # 更新消息记录的音频路径
-            if audio_paths:
-                try:
-                    import soundfile as sf
-                    
-                    # 按顺序读取所有分段音频
-                    audio_segments = []
-                    for seg in sorted(audio_paths, key=lambda x: x["segment_index"]):
-                        file_path = os.path.join(AUDIO_STORAGE_DIR, seg["path"])
-                        data, _ = sf.read(file_path)  # 自动处理格式
-                        audio_segments.append(data)
+            try:
+                # 并发生成音频，按段落顺序返回
+                async for kind, i, segment, segment_response in synthesize_segments_in_order(
+                    assistant_message_id, segment_queue, audio_paths, context.speaker, merged_writer,
+                    audio_format=audio_format
+                ):
+                    if kind == "audio" and segment_response:
+                        if i == 0:
+                            metrics.TIME_TO_FIRST_AUDIO_SECONDS.labels(endpoint="chat").observe(time.monotonic() - received)
+                        segment_response["total_segments"] = total_segments
+                        if not binary:
+                            # 二进制帧不重复携带全文，文本已在text事件中返回
+                            segment_response.update({
+                                "english": display_message["english"],
+                                "chinese": display_message["chinese"]
+                            })
+                        yield format_stream_event(segment_response, binary)
                     
-                    # 合并并保存
-                    if audio_segments:
-                        combined_filename = f"{assistant_message_id}.wav"
-                        combined_path = os.path.join(AUDIO_STORAGE_DIR, combined_filename)
-                        
-                        # 合并成一个numpy数组
-                        full_audio = np.concatenate(audio_segments)
-                        
-                        # 用第一个分段的参数保存（假设参数一致）
-                        sf.write(
-                            combined_path,
-                            full_audio,
-                            audio_paths[0]["sample_rate"],
-                            subtype='PCM_16'
-                        )
-                        
-                        # 更新元数据
-                        assistant.update_message_audio(
-                            assistant_message_id,
-                            audio_paths,
-                            combined_filename
-                        )
-                        
-                except Exception as e:
-                    error(f"音频合并失败: {str(e)}")
+                    # 翻译一旦完成就插入返回，不等待剩余音频
+                    if translation_task and translation_task.done():
+                        yield format_stream_event(await translation_event(), binary)
+                        translation_task = None
+                
+                if translation_task:
+                    yield format_stream_event(await translation_event(), binary)
+                
+                debug(f"消息{assistant_message_id}共生成{len(audio_paths)}段音频")
+                # 更新消息记录的音频路径
+                await finalize_message_audio(assistant_message_id, audio_paths, merged_writer)
+            except BaseException:
+                # 客户端已断开：放弃翻译
+                if translation_task:
+                    translation_task.cancel()
+                raise
+            finally:
+                # 没有完成合并（中断、出错或没有音频）时删除合并文件；已完成的文件不受影响
+                merged_writer.discard()
             
             # # 完成消息
             # completion_response = {
@@ -676,8 +795,8 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
 
         # 返回流式响应
         return StreamingResponse(
-            generate_response_stream(text_segments),
-            media_type="application/x-ndjson"
+            stream_until_disconnect(http_request, generate_response_stream(text_segments)),
+            media_type=media_type
         )
         
     except Exception as e:
@@ -688,11 +807,189 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
             status_code=500,
             content={
                 "error": str(e),
-                "english": "I'm sorry, an error occurred while processing your request.",
-                "chinese": "抱歉，处理请求时发生错误。"
+                **REQUEST_ERROR
             }
         )
 
+def parse_sample_rate(value):
+    """解析客户端提供的PCM采样率，不是整数或超出config.VOICE_SAMPLE_RATE_RANGE时返回None"""
+    try:
+        sample_rate = int(value)
+    except (TypeError, ValueError):
+        return None
+    low, high = config.VOICE_SAMPLE_RATE_RANGE
+    return sample_rate if low <= sample_rate <= high else None
+
+@app.websocket("/ws/voice")
+async def voice_session(websocket: WebSocket):
+    """全双工语音会话：客户端上行麦克风PCM帧，服务端下行转写、文本和音频事件
+
+    客户端消息：
+      - 二进制消息：16bit小端单声道PCM，采样率由sample_rate指定
+      - {"type": "config", "speaker": ..., "sample_rate": ..., "audio_format": ...}：更新会话设置
+      - {"type": "end_utterance"}：结束当前语句，开始转写并回复
+      - {"type": "text", "message": ...}：直接发送文本
+      - {"type": "cancel"}：中断正在进行的回复（为打断功能预留）
+    服务端消息：文本事件为JSON文本消息，音频事件为与/chat二进制传输相同格式的二进制帧。
+    新的语句到达时会取消尚未完成的上一轮回复。
+    """
+    await websocket.accept()
+    new_request_id()
+    
+    session_id = websocket.query_params.get("session_id")
+    if session_id is not None and not re.fullmatch(SESSION_ID_PATTERN, session_id):
+        await websocket.close(code=1008, reason="invalid session_id")
+        return
+    
+    # 连接级上下文：speaker和转写上下文在整个连接内保持
+    context = await assistant.ready_context(
+        websocket.query_params.get("speaker", "default"),
+        session_id,
+        transcripts=[]
+    )
+    audio_format = negotiate_audio_format(websocket.query_params.get("audio_format"), config.STREAM_AUDIO_FORMAT)
+    pcm_buffer = bytearray()
+    pcm_overflow = False  # 当前语句超过最大长度，丢弃后续帧直到end_utterance或cancel
+    turn_task = None
+    
+    async def send_event(event):
+        if "audio_bytes" in event:
+            await websocket.send_bytes(format_stream_event(event, binary=True))
+        else:
+            await websocket.send_text(json.dumps(event, ensure_ascii=False))
+    
+    sample_rate = parse_sample_rate(websocket.query_params.get("sample_rate", config.WHISPER_SAMPLE_RATE))
+    if sample_rate is None:
+        await send_event({"type": "error", "message": "Invalid sample_rate"})
+        await websocket.close(code=1008, reason="invalid sample_rate")
+        return
+    
+    async def run_turn(pcm_bytes=None, text=None):
+        # 每一轮使用独立的请求ID（任务内的上下文变量不影响连接本身）
+        new_request_id()
+        received = time.monotonic()
+        
+        # 每一轮与/chat、/conversation一样占用一个管线槽位，排队已满时告知客户端何时重试
+        try:
+            ticket = await admission.acquire()
+        except AdmissionRejected as e:
+            try:
+                await send_event({
+                    "type": "error",
+                    "message": f"Server busy ({e.reason}), please retry later",
+                    "retry_after": e.retry_after
+                })
+            except Exception:
+                pass
+            return
+        
+        in_flight = metrics.IN_FLIGHT_REQUESTS.labels(endpoint="ws_voice")
+        in_flight.inc()
+        try:
+            if pcm_bytes is not None:
+                # PCM16转float32并重采样到Whisper采样率
+                samples = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+                samples = resample_audio(samples, sample_rate, config.WHISPER_SAMPLE_RATE).astype(np.float32)
+                
+                text = await assistant.stt_model.transcribe_async(samples, context.transcripts)
+                if not text:
+                    await send_event({"type": "error", "message": "No speech detected"})
+                    return
+                
+                await send_event({"type": "transcript", "text": text})
+            
+            # 每一轮都从数据库同步历史记录，包括其他连接和工作进程在此期间写入的消息
+            context.messages = await assistant.conversation_store.history(context.session_id)
+            
+            user_message(text)
+            await asyncio.to_thread(assistant.db_service.save_message, "user", text, session_id=context.session_id)
+            
+            async for event in generate_pipelined_events(text, context, audio_format, received, endpoint="ws_voice"):
+                await send_event(event)
+            
+            await send_event({"type": "turn_complete"})
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            error(f"语音会话处理出错: {e}")
+            import traceback
+            error(traceback.format_exc())
+            try:
+                await send_event({"type": "error", "message": str(e)})
+            except Exception:
+                pass
+        finally:
+            in_flight.dec()
+            ticket.release()
+    
+    def start_turn(**kwargs):
+        nonlocal turn_task
+        # 新一轮开始时中断上一轮未完成的回复
+        if turn_task and not turn_task.done():
+            turn_task.cancel()
+        turn_task = asyncio.create_task(run_turn(**kwargs))
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                if pcm_overflow:
+                    continue
+                if len(pcm_buffer) + len(message["bytes"]) > config.MAX_UTTERANCE_SECONDS * sample_rate * 2:
+                    pcm_buffer.clear()
+                    pcm_overflow = True
+                    await send_event({"type": "error", "message": f"Utterance longer than {config.MAX_UTTERANCE_SECONDS} seconds"})
+                    continue
+                pcm_buffer.extend(message["bytes"])
+                continue
+            
+            try:
+                data = json.loads(message.get("text") or "{}")
+            except json.JSONDecodeError:
+                await send_event({"type": "error", "message": "Invalid JSON message"})
+                continue
+            
+            kind = data.get("type")
+            if kind == "config":
+                new_sample_rate = parse_sample_rate(data.get("sample_rate", sample_rate))
+                if new_sample_rate is None:
+                    await send_event({"type": "error", "message": "Invalid sample_rate"})
+                    continue
+                context.speaker = data.get("speaker") or context.speaker
+                sample_rate = new_sample_rate
+                audio_format = negotiate_audio_format(data.get("audio_format"), audio_format)
+            elif kind == "end_utterance":
+                pcm_bytes = bytes(pcm_buffer)
+                pcm_buffer.clear()
+                if pcm_overflow:
+                    # 超长语句已报错，不再处理
+                    pcm_overflow = False
+                    continue
+                if len(pcm_bytes) < config.MIN_VALID_AUDIO_LENGTH * sample_rate * 2:
+                    await send_event({"type": "error", "message": "Audio too short"})
+                    continue
+                start_turn(pcm_bytes=pcm_bytes)
+            elif kind == "text":
+                if data.get("message", "").strip():
+                    start_turn(text=data["message"])
+            elif kind == "cancel":
+                pcm_buffer.clear()
+                pcm_overflow = False
+                if turn_task and not turn_task.done():
+                    turn_task.cancel()
+            else:
+                await send_event({"type": "error", "message": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if turn_task and not turn_task.done():
+            turn_task.cancel()
+
 # # 添加缺失的/tts_stream端点
 # @app.post("/tts_stream")
 # async def tts_stream(request: StreamTTSRequest):
@@ -763,50 +1060,325 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
 #             content={"error": str(e)}
 #         )
 
-# 辅助函数：将文本分割为合适的段落
-def split_text_into_segments(text, max_length=250):
-    """智能分割文本为较短的段落"""
-    if len(text) <= max_length:
-        return [text]
+# 辅助函数：将TTS输出编码为PCM16 WAV
+def encode_wav_segment(audio_data, sample_rate):
+    """将音频数组编码为单声道16bit WAV字节"""
+    if not isinstance(audio_data, np.ndarray):
+        raise ValueError("音频数据必须为numpy数组")
     
-    segments = []
-    # 优先按句子分割点分段
-    sentence_breaks = re.split(r'(?<=[.!?])\s+', text)
+    # 自动处理数据类型转换
+    if audio_data.dtype == np.float32:
+        # 浮点型需要先归一化再转int16
+        audio_data = np.clip(audio_data, -1.0, 1.0)
+        audio_data = (audio_data * 32767).astype(np.int16)
+    elif audio_data.dtype != np.int16:
+        raise ValueError(f"不支持的音频数据类型: {audio_data.dtype}")
     
-    current_segment = ""
-    for sentence in sentence_breaks:
-        # 如果当前句子加上现有段落超过最大长度且现有段落不为空
-        if len(current_segment + sentence) > max_length and current_segment:
-            segments.append(current_segment.strip())
-            current_segment = sentence
-        # 如果单个句子超过最大长度
-        elif len(sentence) > max_length:
-            # 如果当前段不为空，先添加它
-            if current_segment:
-                segments.append(current_segment.strip())
-                current_segment = ""
-            
-            # 按照逗号、分号等次级分隔符再次分割
-            sub_parts = re.split(r'(?<=[,;:])\s+', sentence)
-            sub_segment = ""
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, 'wb') as wave_file:
+        wave_file.setnchannels(1)
+        wave_file.setframerate(sample_rate)
+        wave_file.setsampwidth(2)
+        wave_file.writeframes(audio_data.tobytes())
+    
+    return wav_buffer.getvalue()
+
+# 辅助函数：按传输格式编码流事件
+def format_stream_event(event, binary=False):
+    """NDJSON模式下音频转为base64字段；二进制模式下打包为长度前缀帧"""
+    payload = event.pop("audio_bytes", b"")
+    
+    if binary:
+        header = json.dumps(event, ensure_ascii=False).encode("utf-8")
+        return struct.pack(">II", len(header), len(payload)) + header + payload
+    
+    if payload:
+        event["audio_data"] = base64.b64encode(payload).decode('utf-8')  # 编码见事件的format和mime_type
+    return json.dumps(event) + "\n"
+
+# 辅助函数：生成、保存单个段落的音频并构造audio事件
+async def synthesize_segment(message_id, index, segment, audio_paths, speaker=None, audio_format="wav"):
+    """生成单个段落的音频，保存到audio_cache，返回audio事件（失败返回None）
+
+    文件始终保存为WAV（用于合并）；返回给客户端的音频按audio_format编码，
+    事件中的wav_bytes供合并写入器使用，发送前需移除。
+    """
+    try:
+        # 生成音频
+        with metrics.TTS_SEGMENT_SECONDS.time():
+            audio_response = await assistant.tts_model.generate_audio_segment(segment, speaker)
+        if not audio_response:
+            return None
+        
+        audio_data, sample_rate = audio_response
+        with metrics.AUDIO_ENCODE_SECONDS.labels(format="wav").time():
+            wav_bytes = encode_wav_segment(audio_data, sample_rate)
+        
+        # 保存文件时增加校验
+        if len(wav_bytes) < 100:  # WAV文件头至少44字节
+            error(f"生成的音频文件过小: {len(wav_bytes)}字节")
+            return None
+        
+        segment_filename = f"{message_id}_{index}.wav"
+        segment_path = os.path.join(AUDIO_STORAGE_DIR, segment_filename)
+        
+        # 交给后台写线程保存，不阻塞事件循环；与下面的编码同时进行
+        write = submit_file_write(segment_path, wav_bytes)
+        
+        # 压缩编码在线程中进行，不阻塞事件循环
+        payload, payload_sample_rate = wav_bytes, sample_rate
+        if audio_format != "wav":
+            with metrics.AUDIO_ENCODE_SECONDS.labels(format=audio_format).time():
+                payload, payload_sample_rate = await asyncio.to_thread(encode_audio, audio_data, sample_rate, audio_format)
+        
+        # 只记录成功写入的段落文件；写入失败时音频仍然发送给客户端
+        try:
+            await write
+        except Exception as e:
+            error(f"保存段落音频{segment_path}失败: {e}")
+        else:
+            audio_paths.append({
+                "segment_index": index,
+                "path": segment_filename,
+                "text": segment,
+                "sample_rate": sample_rate
+            })
+        
+        return {
+            "type": "audio",
+            "message_id": message_id,
+            "segment_index": index,
+            "audio_bytes": payload,  # 由format_stream_event按传输格式编码
+            "wav_bytes": wav_bytes,
+            "format": audio_format,
+            "mime_type": AUDIO_FORMATS[audio_format][2],
+            "sample_rate": payload_sample_rate
+        }
+    except Exception as e:
+        error(f"处理音频段落{index}时出错: {e}")
+        import traceback
+        error(traceback.format_exc())
+        # 继续处理下一个段落，不中断
+        return None
+
+# 辅助函数：有限并发地合成段落音频，按segment_index顺序输出
+async def synthesize_segments_in_order(message_id, segment_queue, audio_paths, speaker=None, merged_writer=None, concurrency=None, audio_format="wav"):
+    """从队列读取(index, text)，最多concurrency个TTS请求同时进行，按顺序产出结果
+
+    依次产出("segment", index, text, None)（段落入队时）和
+    ("audio", index, text, audio事件或None)（按index顺序）。队列中的None表示结束。
+    提供merged_writer时，各段音频按顺序追加到合并文件。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.TTS_MAX_CONCURRENCY))
+    pending = deque()
+    
+    async def bounded_synthesize(index, segment):
+        async with semaphore:
+            return await synthesize_segment(message_id, index, segment, audio_paths, speaker, audio_format)
+    
+    next_segment = asyncio.ensure_future(segment_queue.get())
+    try:
+        while next_segment or pending:
+            # 同时等待新段落和最早的未完成段落，先完成的段落不会因等待LLM而延迟输出
+            waiters = [next_segment] if next_segment else []
+            if pending:
+                waiters.append(pending[0][2])
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
             
-            for part in sub_parts:
-                if len(sub_segment + part) > max_length and sub_segment:
-                    segments.append(sub_segment.strip())
-                    sub_segment = part
+            if next_segment and next_segment.done():
+                item = next_segment.result()
+                if item is None:
+                    next_segment = None
                 else:
-                    sub_segment += (" " if sub_segment else "") + part
+                    index, segment = item
+                    pending.append((index, segment, asyncio.create_task(bounded_synthesize(index, segment))))
+                    next_segment = asyncio.ensure_future(segment_queue.get())
+                    yield "segment", index, segment, None
             
-            if sub_segment:
-                segments.append(sub_segment.strip())
-        else:
-            current_segment += (" " if current_segment else "") + sentence
+            while pending and pending[0][2].done():
+                index, segment, task = pending.popleft()
+                segment_response = task.result()
+                if segment_response:
+                    wav_bytes = segment_response.pop("wav_bytes")
+                    if merged_writer:
+                        merged_writer.append_wav(wav_bytes)
+                yield "audio", index, segment, segment_response
+    finally:
+        if next_segment:
+            next_segment.cancel()
+        for _, _, task in pending:
+            task.cancel()
+
+# 辅助函数：完成合并音频文件并更新消息记录
+async def finalize_message_audio(message_id, audio_paths, merged_writer):
+    """等待后台写入完成，并将分段与合并音频信息写入数据库"""
+    if not audio_paths:
+        return
     
-    # 添加最后一个段落
-    if current_segment:
-        segments.append(current_segment.strip())
+    try:
+        merged_info = None
+        if await merged_writer.close():
+            merged_info = {
+                "merged_path": os.path.basename(merged_writer.path),
+                "sample_rate": merged_writer.sample_rate
+            }
+        
+        # 更新元数据
+        await asyncio.to_thread(
+            assistant.update_message_audio,
+            message_id,
+            sorted(audio_paths, key=lambda x: x["segment_index"]),
+            merged_info
+        )
+    except Exception as e:
+        error(f"音频合并失败: {str(e)}")
+
+def create_merged_writer(message_id):
+    """创建{message_id}.wav的增量合并写入器"""
+    return MergedAudioWriter(os.path.join(AUDIO_STORAGE_DIR, f"{message_id}.wav"))
+
+# 流式管线：LLM逐句生成，句子完成后立即送入TTS
+async def generate_pipelined_events(user_input, context, audio_format="wav", received=None, endpoint="chat_stream"):
+    """边接收LLM输出边合成语音，首句无需等待完整回复和翻译。产出事件字典
+
+    received为收到请求（或语句结束）的时间，用于按endpoint统计首段音频延迟。
+    """
+    received = received or time.monotonic()
+    first_audio = True
+    assistant_message_id = str(uuid.uuid4())
+    sentence_queue = asyncio.Queue()
+    english_sentences = []
+    audio_paths = []
+    merged_writer = create_merged_writer(assistant_message_id)
+    translation_task = None
     
-    return segments
+    async def produce_sentences():
+        nonlocal translation_task
+        try:
+            index = 0
+            segmenter = assistant.tts_model.segmenter()
+            async for sentence in assistant.llm_service.stream_sentences(user_input, context.messages, segmenter):
+                english_sentences.append(sentence)
+                await sentence_queue.put((index, sentence))
+                index += 1
+            
+            # 回复一结束就开始翻译，与剩余段落的TTS并行
+            translation_task = asyncio.create_task(
+                assistant.llm_service.translate(" ".join(english_sentences))
+            )
+        finally:
+            await sentence_queue.put(None)
+    
+    producer = asyncio.create_task(produce_sentences())
+    
+    try:
+        async for kind, i, sentence, segment_response in synthesize_segments_in_order(
+            assistant_message_id, sentence_queue, audio_paths, context.speaker, merged_writer,
+            audio_format=audio_format
+        ):
+            if kind == "segment":
+                # 先返回该句文本，客户端可以立即显示
+                yield {
+                    "type": "text_delta",
+                    "message_id": assistant_message_id,
+                    "segment_index": i,
+                    "text": sentence
+                }
+            elif segment_response:
+                if first_audio:
+                    first_audio = False
+                    metrics.TIME_TO_FIRST_AUDIO_SECONDS.labels(endpoint=endpoint).observe(time.monotonic() - received)
+                yield segment_response
+        
+        # 翻译不阻塞首段音频，此时通常已经完成
+        english_content = " ".join(english_sentences)
+        chinese_content = await translation_task if translation_task else await assistant.llm_service.translate(english_content)
+        
+        display_message = {
+            "english": english_content,
+            "chinese": chinese_content
+        }
+        assistant_message(display_message)
+        
+        # 保存助手回复（使用流开始时分配的ID，与音频文件名一致）
+        await asyncio.to_thread(
+            assistant.db_service.save_message, "assistant", display_message,
+            message_id=assistant_message_id, session_id=context.session_id
+        )
+        
+        yield {
+            "type": "text",
+            "message_id": assistant_message_id,
+            "total_segments": len(english_sentences),
+            "content": display_message,
+            "text": display_message
+        }
+        
+        # 更新消息记录的音频路径
+        await finalize_message_audio(assistant_message_id, audio_paths, merged_writer)
+    except BaseException:
+        # 流被中断时不再需要翻译
+        if translation_task:
+            translation_task.cancel()
+        raise
+    finally:
+        if not producer.done():
+            producer.cancel()
+        # 没有完成合并（中断、出错或没有音频）时删除合并文件；已完成的文件不受影响
+        merged_writer.discard()
+
+async def generate_pipelined_stream(user_input, context, binary=False, audio_format="wav", received=None):
+    """按传输格式输出流式管线事件"""
+    async for event in generate_pipelined_events(user_input, context, audio_format, received):
+        yield format_stream_event(event, binary)
+
+async def wait_for_disconnect(http_request: Request):
+    """等待客户端断开连接"""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def run_unless_disconnected(http_request: Request, coro):
+    """执行coro，客户端先断开时取消它并返回None"""
+    task = asyncio.ensure_future(coro)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait([task, disconnected], return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        info("客户端已断开，取消LLM请求")
+        return None
+    finally:
+        disconnected.cancel()
+        task.cancel()
+
+async def stream_until_disconnect(http_request: Request, stream):
+    """转发流式响应；客户端断开时取消生成器，中止进行中的LLM/TTS请求"""
+    disconnected = asyncio.ensure_future(wait_for_disconnect(http_request))
+    next_item = None
+    try:
+        while True:
+            next_item = asyncio.ensure_future(stream.__anext__())
+            await asyncio.wait([next_item, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if not next_item.done():
+                info("客户端已断开，取消剩余的生成任务")
+                return
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        disconnected.cancel()
+        if next_item and not next_item.done():
+            # 取消会传入生成器内部，由其清理TTS任务、翻译和合并文件
+            next_item.cancel()
+            try:
+                await next_item
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        await stream.aclose()
 
 # 辅助函数：请求TTS服务器生成单个段落的音频
 async def request_tts_for_segment(text, speaker="default"):
@@ -821,16 +1393,11 @@ async def request_tts_for_segment(text, speaker="default"):
             "speaker": speaker
         }
         
-        print(f"\n--- TTS请求 ---")
-        print(f"URL: {tts_url}/tts")
-        print(f"文本: {text}")
-        print(f"说话人: {speaker}")
+        debug(f"TTS请求: {tts_url}/tts, 说话人: {speaker}, 文本长度: {len(text)}")
         
         # 发送请求到TTS服务器
         async with aiohttp.ClientSession() as session:
             async with session.post(f"{tts_url}/tts", json=request_data, timeout=60) as response:
-                print(f"TTS响应状态码: {response.status}")
-                print(f"TTS响应头: {dict(response.headers)}")
                 
                 if response.status != 200:
                     error_text = await response.text()
@@ -838,43 +1405,29 @@ async def request_tts_for_segment(text, speaker="default"):
                 
                 # 读取响应数据（只读取一次）
                 audio_data = await response.read()
-                print(f"收到TTS音频数据，字节大小: {len(audio_data)}")
-                print(f"数据前20字节: {audio_data[:20]}")
                 
                 # 判断响应类型
                 content_type = response.headers.get('Content-Type', '')
-                print(f"内容类型: {content_type}")
+                debug(f"TTS响应: {response.status}, {content_type}, {len(audio_data)}字节")
                 
                 # 根据内容类型处理
                 if 'application/json' in content_type:
                     # 处理JSON响应
                     json_data = json.loads(audio_data)
                     
-                    # 检查JSON响应中的字段
-                    print(f"JSON响应字段: {list(json_data.keys())}")
-                    
                     # 统一使用audio_data字段
                     if 'audio' in json_data:
                         audio_base64 = json_data['audio']
-                        print("从'audio'字段获取音频数据")
                     elif 'audio_data' in json_data:
                         audio_base64 = json_data['audio_data']
-                        print("从'audio_data'字段获取音频数据")
                     else:
                         raise Exception(f"TTS返回了无效的JSON格式: {list(json_data.keys())}")
                 else:
                     # 处理二进制响应
                     audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-                    print("将二进制响应编码为Base64")
                 
                 sample_rate = 24000
                 
-                print(f"--- TTS处理完成 ---\n")
-                
-                # 在return语句前添加
-                print(f"TTS响应格式: audio_data长度={len(audio_base64)}, sample_rate={sample_rate}")
-                debug(f"TTS响应字段: {{'audio_data': '(长度: {len(audio_base64)})', 'sample_rate': {sample_rate}}}")
-                
                 # 统一返回audio_data字段
                 return {
                     "audio_data": audio_base64,
@@ -886,109 +1439,177 @@ async def request_tts_for_segment(text, speaker="default"):
         error(f"错误详情: {traceback.format_exc()}")
         raise
 
+# 历史音频文件浏览器可缓存：消息音频生成后不再改变
+STORED_AUDIO_CACHE_CONTROL = "public, max-age=604800"
+
+def normalize_message_id(message_id):
+    """去掉前端使用的assistant-前缀"""
+    if message_id.startswith("assistant-"):
+        message_id = message_id.split("assistant-", 1)[1]
+    return message_id
+
+def unique_tmp_path(path):
+    """临时文件名：每个写入者（进程和请求）各不相同，并发写同一目标时不会互相截断"""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+def publish_tmp_file(tmp_path, path):
+    """把写好的临时文件原子地替换为目标文件；替换失败但目标已由其他写入者生成时也视为成功"""
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not os.path.exists(path):
+            raise
+
+def merge_segment_files(audio_paths, merged_path):
+    """按段落顺序直接拼接已保存的WAV帧（不经过解码），返回合并后的采样率；失败返回None"""
+    params = None
+    tmp_path = unique_tmp_path(merged_path)
+    try:
+        with wave.open(tmp_path, 'wb') as merged:
+            for segment_info in sorted(audio_paths, key=lambda x: x["segment_index"]):
+                segment_path = os.path.join(AUDIO_STORAGE_DIR, segment_info["path"])
+                if not os.path.exists(segment_path):
+                    continue
+                with wave.open(segment_path, 'rb') as segment:
+                    segment_params = (segment.getnchannels(), segment.getsampwidth(), segment.getframerate())
+                    if params is None:
+                        params = segment_params
+                        merged.setnchannels(params[0])
+                        merged.setsampwidth(params[1])
+                        merged.setframerate(params[2])
+                    elif segment_params != params:
+                        error(f"段落{segment_info['path']}格式不一致，已跳过")
+                        continue
+                    merged.writeframes(segment.readframes(segment.getnframes()))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    if params is None:
+        os.remove(tmp_path)
+        return None
+    publish_tmp_file(tmp_path, merged_path)
+    return params[2]
+
+def ensure_encoded_audio(wav_path, audio_format):
+    """返回指定编码的音频文件路径；压缩格式转码一次后缓存在WAV旁边"""
+    if audio_format == "wav":
+        return wav_path
+    
+    encoded_path = f"{os.path.splitext(wav_path)[0]}.{AUDIO_FORMATS[audio_format][3]}"
+    if os.path.exists(encoded_path) and os.path.getmtime(encoded_path) >= os.path.getmtime(wav_path):
+        return encoded_path
+    
+    with open(wav_path, "rb") as f:
+        encoded, _ = transcode_audio(f.read(), audio_format)
+    tmp_path = unique_tmp_path(encoded_path)
+    with open(tmp_path, "wb") as f:
+        f.write(encoded)
+    publish_tmp_file(tmp_path, encoded_path)
+    return encoded_path
+
+def resolve_message_audio(message_id, audio_format):
+    """定位消息的音频文件（按需合并段落并转码），返回路径；没有音频返回None"""
+    message = assistant.db_service.get_message_by_flexible_id(message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="未找到消息")
+    
+    merged_info = message.get("merged_audio")
+    if merged_info and merged_info.get("merged_path"):
+        merged_path = os.path.join(AUDIO_STORAGE_DIR, merged_info["merged_path"])
+        if os.path.exists(merged_path):
+            return ensure_encoded_audio(merged_path, audio_format)
+    
+    # 段落在回复完成后才写入数据库，此时不会与正在进行的合并写入冲突
+    audio_paths = message.get("audio_paths", [])
+    if not audio_paths:
+        return None
+    
+    # 没有合并文件时由段落拼接一次并记入数据库，之后走上面的合并音频分支
+    # 文件名取自数据库中的消息ID，而不是客户端传入的（可能只是部分匹配的）ID
+    stored_id = message["message_id"]
+    merged_name = f"{stored_id}.wav"
+    merged_path = os.path.join(AUDIO_STORAGE_DIR, merged_name)
+    if os.path.exists(merged_path):
+        with wave.open(merged_path, 'rb') as merged:
+            sample_rate = merged.getframerate()
+    else:
+        sample_rate = merge_segment_files(audio_paths, merged_path)
+        if sample_rate is None:
+            return None
+    
+    assistant.db_service.update_message_audio(
+        stored_id, [], {"merged_path": merged_name, "sample_rate": sample_rate}
+    )
+    return ensure_encoded_audio(merged_path, audio_format)
+
+@app.get("/audio/{message_id}")
+async def get_message_audio(message_id: str, request: Request, audio_format: Optional[str] = "wav"):
+    """直接返回消息的音频文件，支持Range、ETag/Last-Modified和浏览器缓存"""
+    message_id = normalize_message_id(message_id)
+    audio_format = negotiate_audio_format(audio_format)
+    
+    audio_path = await asyncio.to_thread(resolve_message_audio, message_id, audio_format)
+    if not audio_path:
+        raise HTTPException(status_code=404, detail="此消息没有关联音频")
+    
+    stat_result = await asyncio.to_thread(os.stat, audio_path)
+    response = FileResponse(
+        audio_path,
+        media_type=AUDIO_FORMATS[audio_format][2],
+        headers={"Cache-Control": STORED_AUDIO_CACHE_CONTROL},
+        stat_result=stat_result
+    )
+    
+    # 条件请求：文件未变化时返回304
+    validators = {k: response.headers[k] for k in ("etag", "last-modified", "cache-control")}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if validators["etag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=validators)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            if int(stat_result.st_mtime) <= since:
+                return Response(status_code=304, headers=validators)
+        except (TypeError, ValueError):
+            pass
+    
+    return response
+
 @app.post("/get_audio")
 async def get_audio(request: GetAudioRequest):
-    """获取指定消息ID的历史音频数据"""
-    print(f"\n=== 收到获取音频请求 ===")
-    print(f"消息ID: {request.message_id}")
-    
+    """获取指定消息ID的历史音频数据（base64 JSON，新客户端应使用GET /audio/{message_id}）"""
     try:
-        message_id = request.message_id
-        # 尝试删除可能的前缀
-        if message_id.startswith("assistant-"):
-            message_id = message_id.split("assistant-", 1)[1]
+        message_id = normalize_message_id(request.message_id)
+        audio_format = negotiate_audio_format(request.audio_format)
         
-        # 从数据库获取消息，使用增强的查询方法
-        message = assistant.db_service.get_message_by_flexible_id(message_id)
-        print(f"message: {message}")
-        
-        if not message:
-            raise HTTPException(status_code=404, detail="未找到消息")
-        
-        # 检查是否有合并后的音频
-        if "merged_audio" in message and message["merged_audio"]:
-            merged_info = message["merged_audio"]
-            merged_path = os.path.join(AUDIO_STORAGE_DIR, merged_info["merged_path"])
-            
-            if os.path.exists(merged_path):
-                # 返回合并后的单个音频文件
-                with open(merged_path, "rb") as f:
-                    audio_binary = f.read()
-                
-                # 转换为Base64
-                audio_base64 = base64.b64encode(audio_binary).decode('utf-8')
-                
-                # 使用一个段落返回完整音频
-                return JSONResponse({
-                    "type": "audio",
-                    "message_id": message_id,
-                    "audio_data": audio_base64,
-                    "sample_rate": merged_info.get("sample_rate", 24000),
-                    "format": "base64",
-                    "is_merged": True
-                })
-        
-        # 如果没有合并音频，检查是否有音频段落
-        audio_paths = message.get("audio_paths", [])
-        if not audio_paths:
+        audio_path = await asyncio.to_thread(resolve_message_audio, message_id, audio_format)
+        if not audio_path:
             raise HTTPException(status_code=404, detail="此消息没有关联音频")
         
-        # 实时合并音频段落
-        try:
-            # 按段落索引排序
-            sorted_paths = sorted(audio_paths, key=lambda x: x["segment_index"])
-            combined = None
-            sample_rate = None
-            
-            for segment_info in sorted_paths:
-                segment_path = os.path.join(AUDIO_STORAGE_DIR, segment_info["path"])
-                if os.path.exists(segment_path):
-                    segment_audio = AudioSegment.from_file(segment_path)
-                    
-                    if combined is None:
-                        combined = segment_audio
-                        sample_rate = segment_info.get("sample_rate", 24000)
-                    else:
-                        combined += segment_audio
-            
-            if combined is None:
-                raise HTTPException(status_code=404, detail="无法合并音频段落")
-            
-            # 创建临时文件
-            temp_path = os.path.join(AUDIO_STORAGE_DIR, f"temp_{message_id}.wav")
-            combined.export(temp_path, format="wav")
-            
-            # 读取合并后的文件
-            with open(temp_path, "rb") as f:
+        def read_audio():
+            with open(audio_path, "rb") as f:
                 audio_binary = f.read()
-            
-            # 删除临时文件
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-            
-            # 转换为Base64
-            audio_base64 = base64.b64encode(audio_binary).decode('utf-8')
-            
-            # 返回合并后的音频
-            return JSONResponse({
-                "type": "audio",
-                "message_id": message_id,
-                "audio_data": audio_base64,
-                "sample_rate": sample_rate or 24000,
-                "format": "base64",
-                "is_merged": True
-            })
-            
-        except Exception as e:
-            error(f"实时合并音频失败: {e}")
-            import traceback
-            error(traceback.format_exc())
-            
-            # 回退到流式返回个别段落
-            # ... 原有的流式返回代码 ...
-            raise HTTPException(status_code=500, detail=f"合并音频失败: {str(e)}")
+            return audio_binary, sf.info(audio_path).samplerate
+        
+        audio_binary, sample_rate = await asyncio.to_thread(read_audio)
+        
+        # 使用一个段落返回完整音频
+        return JSONResponse({
+            "type": "audio",
+            "message_id": message_id,
+            "audio_data": base64.b64encode(audio_binary).decode('utf-8'),
+            "sample_rate": sample_rate,
+            "format": "base64",
+            "codec": audio_format,
+            "mime_type": AUDIO_FORMATS[audio_format][2],
+            "url": f"/audio/{message_id}?audio_format={audio_format}",
+            "is_merged": True
+        })
             
     except HTTPException:
         raise
@@ -998,6 +1619,41 @@ async def get_audio(request: GetAudioRequest):
         error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus指标：各阶段延迟直方图、进行中请求数、后端错误数和TTS缓存统计"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/healthz")
+async def healthz():
+    """存活检查：进程和事件循环正常即返回200，不访问任何后端"""
+    return {"status": "ok", "uptime_seconds": round(time.monotonic() - STARTED_AT, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """就绪检查：返回各项检查结果，必需的检查未全部通过时返回503"""
+    ready, checks = await readiness.check()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "model": assistant.llm_service.model,
+            "checks": checks
+        }
+    )
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """准入控制的槽位占用和排队时间统计"""
+    return admission.stats()
+
+@app.get("/tts_cache/stats")
+async def tts_cache_stats():
+    """TTS音频缓存命中统计"""
+    if not assistant.tts_model.cache:
+        return {"enabled": False}
+    return {"enabled": True, **assistant.tts_model.cache.stats()}
+
 @app.get("/debug/messages")
 async def debug_messages(Message):
     """列出数据库中的所有消息记录及其ID"""
@@ -1029,15 +1685,14 @@ async def debug_messages(Message):
 # @app.event("startup")
 async def startup_event():
     """服务启动时执行的操作"""
-    print("\n=== 服务启动 ===")
-    print("可用路由:")
+    info("=== 服务启动 ===")
     for route in app.routes:
-        print(f"{route.methods} {route.path}")
+        debug(f"路由: {getattr(route, 'methods', None)} {route.path}")
     
     # 确保ID一致性
     assistant.db_service.ensure_consistent_message_ids()
     
-    print("=== 服务启动完成 ===\n")
+    info("=== 服务启动完成 ===")
 
 @app.middleware("http")
 async def add_required_fields(request: Request, call_next):
@@ -1052,15 +1707,37 @@ async def add_required_fields(request: Request, call_next):
             status_code=500,
             content={
                 "error": str(e),
-                "english": "I'm sorry, an error occurred while processing your request.",
-                "chinese": "抱歉，处理请求时发生错误。"
+                **REQUEST_ERROR
             }
         )
 
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """为每个请求分配请求ID（沿用合法的X-Request-ID请求头），写入每条日志并在响应头返回"""
+    client_id = request.headers.get("x-request-id", "")
+    request_id = new_request_id(client_id if re.fullmatch(r"[\w.-]{1,64}", client_id) else None)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 def main():
     """Main entry point."""
     logger.info("Starting server...")
     
+    if config.WORKERS > 1:
+        # 多进程：历史记录保存在数据库中，各工作进程状态一致；每个工作进程重新导入本模块
+        # Prometheus指标写入共享目录，/metrics合并所有工作进程的数据
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="weebo-metrics-"))
+        uvicorn.run(
+            "main:app",
+            host=config.SERVER_HOST,
+            port=config.SERVER_PORT,
+            workers=config.WORKERS,
+            log_level="info",
+            access_log=True
+        )
+        return
+    
     def signal_handler(sig, frame):
         """Handle shutdown signals."""
         logger.info("Shutting down...")
@@ -1070,10 +1747,10 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     
     # 使用以下配置确保WebSocket在HTTPS下工作
-    config = uvicorn.Config(
+    server_config = uvicorn.Config(
         app,
-        host="0.0.0.0",
-        port=8080,
+        host=config.SERVER_HOST,
+        port=config.SERVER_PORT,
         log_level="info",
         access_log=True,
         # 临时注释掉SSL配置
@@ -1081,7 +1758,7 @@ def main():
         # ssl_certfile="./cert.pem"
     )
     
-    server = uvicorn.Server(config)
+    server = uvicorn.Server(server_config)
     server.run()
 
 if __name__ == "__main__":
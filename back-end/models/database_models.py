@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, create_engine
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Index, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
 import json
@@ -7,11 +8,27 @@ import os
 
 Base = declarative_base()
 
+# 未指定session_id的请求（以及加入会话之前保存的旧消息）都属于默认会话
+DEFAULT_SESSION_ID = "default"
+
+def parse_content(content):
+    """解析消息内容：助手回复是JSON，用户消息可能是纯文本"""
+    if not isinstance(content, str):
+        return content
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return content
+
+
 class Message(Base):
     """消息模型"""
     __tablename__ = "messages"
+    # 按会话加载历史记录：WHERE session_id = ? AND id > ? ORDER BY id
+    __table_args__ = (Index("ix_messages_session_id_id", "session_id", "id"),)
     
     id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(100), nullable=False, default=DEFAULT_SESSION_ID)  # 所属会话
     key = Column(String(255), unique=True, index=True)  # 消息唯一标识符
     role = Column(String(50))  # 角色：user 或 assistant
     message_id = Column(String(100), index=True)  # UUID格式的消息ID
@@ -24,10 +41,11 @@ class Message(Base):
         """将模型转换为字典"""
         result = {
             "id": self.id,
+            "session_id": self.session_id,
             "key": self.key,
             "role": self.role,
             "message_id": self.message_id,
-            "content": json.loads(self.content) if isinstance(self.content, str) else self.content,
+            "content": parse_content(self.content),
             "timestamp": self.timestamp.isoformat(),
             "audio_paths": [segment.to_dict() for segment in self.audio_segments] if self.audio_segments else []
         }
@@ -77,17 +95,47 @@ class MergedAudio(Base):
             "sample_rate": self.sample_rate
         }
 
+def upgrade_schema(engine):
+    """为旧数据库补充后来加入的列和索引（create_all不会修改已存在的表）"""
+    with engine.begin() as connection:
+        columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(messages)")]
+        if "session_id" not in columns:
+            # 已有的消息都归入默认会话
+            connection.exec_driver_sql(
+                f"ALTER TABLE messages ADD COLUMN session_id VARCHAR(100) NOT NULL DEFAULT '{DEFAULT_SESSION_ID}'"
+            )
+        connection.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_messages_session_id_id ON messages (session_id, id)"
+        )
+
+
 # 数据库初始化函数
 def init_db(db_path):
     """初始化数据库连接和表结构"""
     # 确保目录存在
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    # 创建数据库引擎
-    engine = create_engine(f"sqlite:///{db_path}")
+    # 创建数据库引擎；多个工作进程共用同一数据库文件，写锁冲突时等待而不是立即报错
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"timeout": 30})
+    
+    # WAL模式：读不阻塞写，多进程并发读写时不会互相锁住
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
     
-    # 创建所有表
-    Base.metadata.create_all(engine)
+    # 创建所有表并升级旧表结构；多个工作进程同时初始化时，别的进程可能刚建好某张表、
+    # 索引或刚加上某一列，create_all和upgrade_schema都只处理缺少的部分，重试几次即可
+    for attempt in range(5):
+        try:
+            Base.metadata.create_all(engine)
+            upgrade_schema(engine)
+            break
+        except OperationalError:
+            if attempt == 4:
+                raise
     
     # 创建会话工厂
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
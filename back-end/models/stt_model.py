@@ -1,10 +1,11 @@
 """Speech-to-text model service."""
-import requests
+import asyncio
 import io
 import numpy as np
 import soundfile as sf
 from utils.logging_utils import debug, info, error
 import config
+from services.metrics import STT_SECONDS, BACKEND_ERRORS
 import json
 
 class SpeechToTextModel:
@@ -15,9 +16,22 @@ class SpeechToTextModel:
         self.api_url = api_url
         self.language = "en"  # Default language
         self.previous_transcripts = []  # Store recent transcripts for context
+        self._semaphore = asyncio.Semaphore(config.MAX_THREADS)  # Bounds concurrent Whisper requests
     
-    def transcribe(self, audio_data):
-        """Transcribe audio data to text."""
+    async def transcribe_async(self, audio_data, transcripts=None):
+        """Transcribe on a worker thread; requests over the limit wait on the event loop, not in a thread."""
+        async with self._semaphore:
+            return await asyncio.to_thread(self.transcribe, audio_data, transcripts)
+    
+    def transcribe(self, audio_data, transcripts=None):
+        """Transcribe audio data to text.
+        
+        ``transcripts`` holds the recent transcripts of the conversation used as
+        context; it defaults to this model's own list.
+        """
+        if transcripts is None:
+            transcripts = self.previous_transcripts
+        
         try:
             # 确保输入是numpy数组
             if not isinstance(audio_data, np.ndarray):
@@ -40,7 +54,7 @@ class SpeechToTextModel:
             files = {'file': ('audio.wav', buffer, 'audio/wav')}
             
             # Add context from previous transcripts to improve accuracy
-            context = " ".join(self.previous_transcripts[-3:]) if self.previous_transcripts else ""
+            context = " ".join(transcripts[-3:]) if transcripts else ""
             
             data = {
                 'language': self.language,
@@ -60,7 +74,9 @@ class SpeechToTextModel:
             }
             
             debug(f"Sending audio to Whisper API with context length: {len(context)}")
-            response = requests.post(self.api_url, files=files, data=data)
+            import requests  # Only voice input needs it, so the server does not import it at startup
+            with STT_SECONDS.time():
+                response = requests.post(self.api_url, files=files, data=data)
             
             debug(f"Whisper API response status: {response.status_code}")
             if response.status_code == 200:
@@ -74,17 +90,19 @@ class SpeechToTextModel:
                 
                 # Store transcript for future context if it's not empty
                 if transcript and len(transcript) > 5:
-                    self.previous_transcripts.append(transcript)
+                    transcripts.append(transcript)
                     # Keep only the last 5 transcripts
-                    self.previous_transcripts = self.previous_transcripts[-5:]
+                    del transcripts[:-5]
                 
                 return transcript
             else:
                 error(f"Whisper API error: {response.status_code}")
+                BACKEND_ERRORS.labels(backend="stt").inc()
                 debug(f"API error response: {response.text}")
                 return None
         except Exception as e:
             error(f"Transcription error: {e}")
+            BACKEND_ERRORS.labels(backend="stt").inc()
             return None
     
     def _post_process_transcript(self, transcript):
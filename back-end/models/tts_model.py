@@ -1,15 +1,16 @@
 """Text-to-speech model service."""
 import numpy as np
-import requests
 import io
 import soundfile as sf
 import aiohttp
-from datetime import datetime
-import os
 import asyncio
 from utils.logging_utils import debug, info, error
 import config
-import re
+import time
+from collections import deque
+from services.tts_cache import TTSCache
+from services.metrics import TTS_REQUESTS, BACKEND_ERRORS
+from utils.text_utils import AdaptiveSegmenter, segment_sizes_for_throughput
 
 class TextToSpeechModel:
     """Service for text-to-speech conversion."""
@@ -18,6 +19,22 @@ class TextToSpeechModel:
         """Initialize TTS model."""
         self.api_url = api_url
         self.tts_mode = config.TTS_MODE
+        self.speaker = config.TTS_SPEAKER  # Default speaker when a request does not choose one
+        
+        # Cache of synthesized audio, keyed by text, speaker and generation parameters
+        self.cache = TTSCache() if config.TTS_CACHE_ENABLED else None
+        
+        # Pre-rendered audio of canned responses, keyed by (speaker, text); never evicted
+        self.canned_audio = {}
+        
+        # In-flight synthesis tasks by request key, shared by identical concurrent requests
+        self._inflight = {}
+        
+        # Bounds requests in flight to the TTS server across all replies
+        self._server_semaphore = asyncio.Semaphore(config.TTS_SERVER_CONCURRENCY)
+        
+        # (characters, seconds) of recent TTS server calls, used to size segments
+        self.throughput_samples = deque(maxlen=50)
         
         # For local TTS (if needed)
         self.tts_session = None
@@ -74,7 +91,62 @@ class TextToSpeechModel:
         """Set the speaker for TTS."""
         self.speaker = speaker
     
-    async def generate_audio_async(self, text):
+    def resolve_speaker(self, speaker=None):
+        """Map an unset speaker or the clients' "default" placeholder to the configured speaker."""
+        if not speaker or speaker == "default":
+            return self.speaker
+        return speaker
+    
+    def throughput_estimate(self):
+        """Estimate (per-call overhead seconds, characters per second) from recent TTS calls."""
+        if len(self.throughput_samples) < 5:
+            return None
+        
+        # 最小二乘拟合 seconds = overhead + characters / chars_per_second
+        chars = np.array([c for c, _ in self.throughput_samples], dtype=np.float64)
+        seconds = np.array([s for _, s in self.throughput_samples], dtype=np.float64)
+        if np.ptp(chars) == 0:
+            return None
+        slope, overhead = np.polyfit(chars, seconds, 1)
+        if slope <= 0:
+            return None
+        return max(overhead, 0.0), 1.0 / slope
+    
+    def segmenter(self):
+        """Create a segmenter for one reply, sized from measured TTS throughput when available."""
+        sizes = {
+            "first_length": config.TTS_SEGMENT_FIRST_LENGTH,
+            "growth": config.TTS_SEGMENT_GROWTH,
+            "max_length": config.TTS_SEGMENT_MAX_LENGTH
+        }
+        estimate = self.throughput_estimate() if config.TTS_ADAPTIVE_SEGMENTS else None
+        if estimate:
+            sizes = segment_sizes_for_throughput(
+                *estimate,
+                target_first_audio_seconds=config.TTS_TARGET_FIRST_AUDIO_SECONDS,
+                max_length=config.TTS_SEGMENT_MAX_LENGTH
+            )
+        return AdaptiveSegmenter(**sizes)
+    
+    def split(self, text, speaker=None):
+        """Split a reply into TTS segments; a canned response stays whole so it hits its pre-rendered audio."""
+        if (self.resolve_speaker(speaker), ' '.join(text.split())) in self.canned_audio:
+            return [text]
+        return self.segmenter().split(text)
+    
+    async def prerender(self, texts, speakers=None):
+        """Synthesize canned texts ahead of time so they are served without calling the TTS server."""
+        for speaker in {self.resolve_speaker(speaker) for speaker in speakers or [None]}:
+            for text in texts:
+                key = (speaker, ' '.join(text.split()))
+                if key in self.canned_audio:
+                    continue
+                result = await self._generate_audio_for_text(key[1], speaker)
+                if result is not None:
+                    self.canned_audio[key] = result
+        debug(f"Pre-rendered {len(self.canned_audio)} canned responses")
+    
+    async def generate_audio_async(self, text, speaker=None):
         """Asynchronously generate audio from text using API."""
         if not text or not text.strip():
             return None
@@ -84,22 +156,8 @@ class TextToSpeechModel:
         # 检查文本长度，如果过长则分段处理
         if len(text) > 500:  # 如果超过500个字符
             debug(f"Text is long ({len(text)} chars), splitting into chunks")
-            # 使用自然断句点分割文本
-            sentences = re.split(r'(?<=[.!?])\s+', text)
-            chunks = []
-            current_chunk = ""
-            
-            # 组合成适当大小的块
-            for sentence in sentences:
-                if len(current_chunk) + len(sentence) < 500:
-                    current_chunk += (" " if current_chunk else "") + sentence
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = sentence
-            
-            if current_chunk:  # 添加最后一个块
-                chunks.append(current_chunk)
+            # 结果整体返回，无需缩短首段，使用固定500字符的块
+            chunks = AdaptiveSegmenter(first_length=500, max_length=500, fill=1.0).split(text)
             
             debug(f"Split into {len(chunks)} chunks")
             
@@ -107,7 +165,7 @@ class TextToSpeechModel:
             audio_segments = []
             for i, chunk in enumerate(chunks):
                 debug(f"Processing chunk {i+1}/{len(chunks)}: {chunk[:30]}...")
-                result = await self._generate_audio_for_text(chunk)
+                result = await self._generate_audio_for_text(chunk, speaker)
                 if result:
                     audio_segments.append(result)
             
@@ -120,23 +178,68 @@ class TextToSpeechModel:
             return None
         else:
             # 原始处理逻辑
-            return await self._generate_audio_for_text(text)
+            return await self._generate_audio_for_text(text, speaker)
         
     # 提取实际的API调用到单独的方法
-    async def _generate_audio_for_text(self, text):
+    async def _generate_audio_for_text(self, text, speaker=None):
         request_data = {
             "text": text,
             "model_type": "Transformer",
             "language": "en-us",
-            "speaker": self.speaker,
+            "speaker": self.resolve_speaker(speaker),
             "cfg_scale": 2.0,
             "min_p": 0.1,
             "seed": 421
         }
         
+        # 预渲染的固定回复（错误提示等）直接返回
+        canned = self.canned_audio.get((request_data["speaker"], ' '.join(text.split())))
+        if canned is not None:
+            TTS_REQUESTS.labels(source="canned").inc()
+            return canned
+        
+        # 相同参数的并发请求合并为一次合成，后来者等待第一个请求的结果
+        key = TTSCache.make_key(request_data)
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._synthesize(text, request_data, key))
+            entry = self._inflight[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _: self._forget_inflight(key, entry))
+        else:
+            debug(f"Joining in-flight TTS request: {text[:30]}...")
+            TTS_REQUESTS.labels(source="coalesced").inc()
+        
+        entry["waiters"] += 1
+        try:
+            # shield: 一个调用方取消不影响其他等待同一结果的调用方
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # 没有调用方在等待了，中止合成
+                self._forget_inflight(key, entry)
+                entry["task"].cancel()
+    
+    def _forget_inflight(self, key, entry):
+        """Drop an in-flight entry unless a newer request already replaced it."""
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+    
+    async def _synthesize(self, text, request_data, cache_key):
+        """Synthesize one request, serving it from the cache when possible."""
+        # 参数固定时TTS输出是确定的，命中缓存则无需请求TTS服务器
+        if self.cache:
+            cached_audio = await self.cache.get(cache_key)
+            if cached_audio is not None:
+                debug(f"TTS cache hit: {text[:30]}...")
+                TTS_REQUESTS.labels(source="cache").inc()
+                return self._decode_audio(cached_audio)
+        
         # API调用逻辑（与原来相同，但超时更长）
+        TTS_REQUESTS.labels(source="server").inc()
         try:
-            async with aiohttp.ClientSession() as session:
+            async with self._server_semaphore, aiohttp.ClientSession() as session:
+                started = time.monotonic()
                 async with session.post(
                     self.api_url,
                     json=request_data,
@@ -144,61 +247,62 @@ class TextToSpeechModel:
                 ) as response:
                     if response.status == 200:
                         audio_data = await response.read()
+                        self.throughput_samples.append((len(text), time.monotonic() - started))
                         if len(audio_data) == 0:
                             error("Received empty response from TTS API")
+                            BACKEND_ERRORS.labels(backend="tts").inc()
                             return None
                             
-                        # Ensure tmp directory exists
-                        os.makedirs('tmp', exist_ok=True)
-                        
-                        # Save audio file for debugging
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                        audio_filename = f'tmp/audio_{timestamp}.wav'
-                        
-                        with open(audio_filename, 'wb') as f:
-                            f.write(audio_data)
-                        
-                        debug(f"Saved audio to {audio_filename}")
-                        
                         # Process audio data
-                        try:
-                            with io.BytesIO(audio_data) as audio_io:
-                                # Use soundfile to read the WAV data
-                                audio_array, samplerate = sf.read(audio_io)
-                                
-                                # Ensure audio is float32
-                                if audio_array.dtype != np.float32:
-                                    audio_array = audio_array.astype(np.float32)
-                                
-                                # If audio is stereo, convert to mono
-                                if len(audio_array.shape) > 1 and audio_array.shape[1] > 1:
-                                    audio_array = np.mean(audio_array, axis=1)
-                                
-                                # 归一化到 [-1.0, 1.0] 范围
-                                max_val = np.max(np.abs(audio_array))
-                                if max_val > 0:
-                                    audio_array /= max_val
-                                
-                                debug(f"Audio processed successfully: shape={audio_array.shape}, sr={samplerate}")
-                                # Return both the audio array and the sample rate
-                                return (audio_array, samplerate)
-                        except Exception as e:
-                            error(f"Failed to process audio data: {e}")
-                            import traceback
-                            debug(f"Audio processing error details: {traceback.format_exc()}")
-                            return None
+                        result = self._decode_audio(audio_data)
+                        if result is not None and self.cache:
+                            await self.cache.put(cache_key, audio_data)
+                        return result
                     else:
                         error_text = await response.text()
                         error(f"generate_audio_async API request failed: {response.status}")
+                        BACKEND_ERRORS.labels(backend="tts").inc()
                         debug(f"Error response: {error_text}")
                         return None
                         
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             error(f"Failed to generate audio via API: {e}")
+            BACKEND_ERRORS.labels(backend="tts").inc()
             import traceback
             debug(f"Exception details: {traceback.format_exc()}")
             return None
     
+    def _decode_audio(self, audio_data):
+        """Decode WAV bytes from the TTS server into a normalized mono float32 array."""
+        try:
+            with io.BytesIO(audio_data) as audio_io:
+                # Use soundfile to read the WAV data
+                audio_array, samplerate = sf.read(audio_io)
+                
+                # Ensure audio is float32
+                if audio_array.dtype != np.float32:
+                    audio_array = audio_array.astype(np.float32)
+                
+                # If audio is stereo, convert to mono
+                if len(audio_array.shape) > 1 and audio_array.shape[1] > 1:
+                    audio_array = np.mean(audio_array, axis=1)
+                
+                # 归一化到 [-1.0, 1.0] 范围
+                max_val = np.max(np.abs(audio_array))
+                if max_val > 0:
+                    audio_array /= max_val
+                
+                debug(f"Audio processed successfully: shape={audio_array.shape}, sr={samplerate}")
+                # Return both the audio array and the sample rate
+                return (audio_array, samplerate)
+        except Exception as e:
+            error(f"Failed to process audio data: {e}")
+            import traceback
+            debug(f"Audio processing error details: {traceback.format_exc()}")
+            return None
+    
     # def generate_audio_sync(self, text):
     #     """Generate audio synchronously."""
     #     if not text or not text.strip():
@@ -292,12 +396,12 @@ class TextToSpeechModel:
         return audio_segments
 
     # 添加新方法，用于处理单个文本段
-    async def generate_audio_segment(self, text):
-        """生成单个文本段的音频，不拼接"""
+    async def generate_audio_segment(self, text, speaker=None):
+        """生成单个文本段的音频，不拼接。speaker为空时使用默认speaker"""
         if not text or not text.strip():
             return None
         
         text = ' '.join(text.split())
         
         # 直接调用API生成单段音频
-        return await self._generate_audio_for_text(text)
\ No newline at end of file
+        return await self._generate_audio_for_text(text, speaker)
\ No newline at end of file
@@ -36,4 +36,12 @@ IMPORTANT RULES for text-to-speech output:
 
 Remember: Write ONLY plain text that can be naturally spoken aloud.
 NO descriptive markers, actions, or special formatting of any kind.
-"""
\ No newline at end of file
+"""
+SUMMARY_PROMPT = """
+You summarize conversations between a user and an assistant, so the assistant can remember them later.
+Merge the existing summary and the new messages into one updated summary.
+Keep names, facts about the user, preferences, plans and open questions.
+Drop greetings, small talk and wording details.
+Write plain sentences in English, in the third person, under 150 words.
+Reply with the summary only.
+"""
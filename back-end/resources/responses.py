@@ -0,0 +1,44 @@
+"""Canned responses returned when a backend fails."""
+
+PROCESSING_ERROR = {
+    "english": "I'm sorry, I encountered an error while processing your request.",
+    "chinese": "抱歉，处理您的请求时遇到错误。"
+}
+
+REQUEST_ERROR = {
+    "english": "I'm sorry, an error occurred while processing your request.",
+    "chinese": "抱歉，处理请求时发生错误。"
+}
+
+LLM_ERROR = {
+    "english": "I'm sorry, I encountered an error while processing your request. Please try again.",
+    "chinese": "抱歉，处理您的请求时遇到错误。请再试一次。"
+}
+
+LLM_EMPTY = {
+    "english": "I'm sorry, I couldn't generate a proper response. Could you try asking again?",
+    "chinese": "抱歉，我无法生成适当的回应。您能再试一次吗？"
+}
+
+MODEL_CONNECTION_ERROR = {
+    "english": "I'm sorry, there was an error connecting to my language model ({model}). Please try again later.",
+    "chinese": "抱歉，连接到我的语言模型 ({model}) 时出现错误。请稍后再试。"
+}
+
+CANNED_RESPONSES = [PROCESSING_ERROR, REQUEST_ERROR, LLM_ERROR, LLM_EMPTY, MODEL_CONNECTION_ERROR]
+
+
+def fallback_response(canned, **kwargs):
+    """Build an english/chinese/display response from a canned response."""
+    english = canned["english"].format(**kwargs)
+    chinese = canned["chinese"].format(**kwargs)
+    return {
+        "english": english,
+        "chinese": chinese,
+        "display": f"{english}\n\n{chinese}"
+    }
+
+
+def canned_english_texts(**kwargs):
+    """English texts of all canned responses, e.g. for pre-rendering their audio."""
+    return [canned["english"].format(**kwargs) for canned in CANNED_RESPONSES]
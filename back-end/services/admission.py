@@ -0,0 +1,113 @@
+"""Admission control for conversation pipelines."""
+import asyncio
+import math
+import time
+from utils.logging_utils import debug
+from services.metrics import ADMISSION_QUEUE_SECONDS
+import config
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed because the wait queue is full or too slow."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A granted pipeline slot; release it exactly once when the pipeline ends."""
+
+    def __init__(self, controller, queued_seconds):
+        self.controller = controller
+        self.queued_seconds = queued_seconds
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        """Give the slot back to the controller."""
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(time.monotonic() - self.admitted_at)
+
+
+class AdmissionController:
+    """Bound the number of pipelines running at once.
+
+    At most ``max_active`` pipelines run; up to ``max_queue`` more wait in FIFO
+    order for at most ``queue_timeout`` seconds. Anything beyond that is rejected
+    immediately, so admitted requests keep predictable latency instead of every
+    request timing out against the backends together.
+    """
+
+    def __init__(self, max_active=config.MAX_ACTIVE_PIPELINES,
+                 max_queue=config.MAX_QUEUED_PIPELINES,
+                 queue_timeout=config.PIPELINE_QUEUE_TIMEOUT):
+        """Initialize the controller."""
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_active)
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self._avg_hold_seconds = None  # Moving average of how long a slot is held
+
+    def retry_after(self):
+        """Estimate in whole seconds when a rejected client should retry."""
+        hold = self._avg_hold_seconds or 1.0
+        return max(1, math.ceil(hold * (self.waiting + 1) / self.max_active))
+
+    async def acquire(self):
+        """Wait for a pipeline slot and return its ticket, or raise AdmissionRejected."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("queue full", self.retry_after())
+
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected("queue timeout", self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        queued = time.monotonic() - start
+        self.active += 1
+        self.admitted += 1
+        self.total_queue_seconds += queued
+        self.max_queue_seconds = max(self.max_queue_seconds, queued)
+        ADMISSION_QUEUE_SECONDS.observe(queued)
+        if queued > 0.01:
+            debug(f"Pipeline admitted after {queued:.2f}s in queue")
+        return AdmissionTicket(self, queued)
+
+    def _release(self, held_seconds):
+        self.active -= 1
+        if self._avg_hold_seconds is None:
+            self._avg_hold_seconds = held_seconds
+        else:
+            self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held_seconds
+        self._semaphore.release()
+
+    def stats(self):
+        """Return slot usage and queue-time counters."""
+        return {
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_queue_seconds": self.total_queue_seconds / self.admitted if self.admitted else 0.0,
+            "max_queue_seconds": self.max_queue_seconds,
+            "avg_hold_seconds": self._avg_hold_seconds or 0.0
+        }
@@ -1,12 +1,8 @@
 """Audio processing service."""
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
 import io
 import queue
 import threading
-import requests
-import aiohttp
 from datetime import datetime
 import os
 import traceback
@@ -14,6 +10,11 @@ from utils.logging_utils import debug, info, error
 import config
 import time  # 添加time模块导入
 
+def _sounddevice():
+    """Import sounddevice on first use; it loads PortAudio, which headless servers lack."""
+    import sounddevice
+    return sounddevice
+
 class AudioService:
     """Service for audio recording and playback."""
     
@@ -25,14 +26,23 @@ class AudioService:
         self.audio_playing = threading.Event()
         self.interrupt_queue = queue.Queue()
         self.noise_profile = None  # 初始化噪声特征
-        
-        # Start audio player thread
-        self.audio_thread = threading.Thread(target=self.audio_player_thread)
-        self.audio_thread.daemon = True
-        self.audio_thread.start()
+        self._player_lock = threading.Lock()
+    
+    def _ensure_player_thread(self):
+        """Start the audio player thread on first playback (local mode only)."""
+        with self._player_lock:
+            if self.audio_thread is None or not self.audio_thread.is_alive():
+                self.audio_thread = threading.Thread(target=self.audio_player_thread)
+                self.audio_thread.daemon = True
+                self.audio_thread.start()
     
     def audio_player_thread(self):
         """Thread for sequential audio playback."""
+        try:
+            sd = _sounddevice()
+        except (ImportError, OSError) as e:
+            error(f"Audio playback unavailable: {e}")
+            return
         while not self.shutdown_event.is_set():
             try:
                 # audio_data is a tuple (audio_array, samplerate)
@@ -78,6 +88,7 @@ class AudioService:
     def record_audio(self):
         """Record audio from microphone."""
         try:
+            sd = _sounddevice()
             # Initialize variables
             audio_buffer = []
             is_speaking = False
@@ -174,6 +185,7 @@ class AudioService:
     def play_audio(self, audio_data, samplerate=config.SAMPLE_RATE):
         """Add audio to the playback queue."""
         if audio_data is not None:
+            self._ensure_player_thread()
             # Ensure audio_data is a numpy array
             if isinstance(audio_data, tuple) and len(audio_data) == 2:
                 # If it's a tuple (audio_array, samplerate)
@@ -186,6 +198,7 @@ class AudioService:
     def check_for_interrupt(self):
         """Listen for interrupting sounds."""
         try:
+            sd = _sounddevice()
             def callback(indata, frames, time_info, status):
                 if status:
                     error(f"Status: {status}")
@@ -210,6 +223,7 @@ class AudioService:
     def play_audio_with_interrupt(self, audio_data):
         """Play audio with interrupt capability."""
         try:
+            sd = _sounddevice()
             self.audio_playing.set()
             
             # Start interrupt detection thread
@@ -269,6 +283,7 @@ class AudioService:
     def capture_noise_profile(self, duration=1.0):
         """Capture ambient noise profile for noise reduction."""
         try:
+            sd = _sounddevice()
             info("Capturing ambient noise profile... Please be quiet.")
             
             # Record ambient noise
@@ -0,0 +1,103 @@
+"""Token-budgeted view of a conversation's history for the LLM prompt."""
+import asyncio
+import config
+from utils.logging_utils import debug, error
+from utils.text_utils import estimate_tokens
+from services.metrics import LLM_HISTORY_TOKENS
+
+# Role markers and separators added by the chat template around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message):
+    """Estimate the tokens one chat message adds to the prompt."""
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """Keep the prompt history of one conversation within a token budget.
+
+    The prompt is the system prompt, a summary of older turns, and as many of
+    the most recent messages (up to ``max_turns`` exchanges) as fit in
+    ``max_tokens``. When messages fall out of the window, ``summarize`` folds
+    them into the summary on a background task, so the turn that pushed them
+    out is not delayed; until it finishes, the prompt uses the previous summary.
+    The summary runs ahead of the window by ``max_turns`` messages, so once a
+    conversation outgrows the window it costs one summary call every
+    ``max_turns / 2`` turns rather than one per turn.
+    """
+
+    def __init__(self, summarize=None, max_tokens=config.LLM_CONTEXT_TOKENS,
+                 max_turns=config.LLM_CONTEXT_TURNS, chunk_tokens=config.LLM_CONTEXT_TOKENS):
+        """Initialize the window.
+
+        ``summarize(summary, messages)`` is a coroutine function returning the
+        updated summary, or None when it fails. Each call receives at most
+        about ``chunk_tokens`` of messages.
+        """
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.chunk_tokens = chunk_tokens
+        self.summary = ""
+        self.summarized = 0  # Messages before this index are covered by the summary
+        self._task = None
+
+    def build(self, system_message, messages):
+        """Return the prompt history for ``messages`` (the conversation without a system prompt)."""
+        prompt = [system_message]
+        if self.summary:
+            prompt.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        budget = self.max_tokens - sum(message_tokens(message) for message in prompt)
+
+        start = len(messages)
+        while start > 0 and len(messages) - start < self.max_turns * 2:
+            cost = message_tokens(messages[start - 1])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+
+        if start > self.summarized:
+            # Cover a few turns past the window edge, so one call serves the next several turns
+            self._schedule(messages, min(len(messages), start + self.max_turns))
+
+        prompt += messages[start:]
+        LLM_HISTORY_TOKENS.observe(self.max_tokens - budget)
+        return prompt
+
+    def _schedule(self, messages, end):
+        if self.summarize is None or (self._task is not None and not self._task.done()):
+            return
+        # A snapshot: the caller's list keeps growing while the task runs
+        self._task = asyncio.create_task(self._summarize(list(messages[:end])))
+
+    async def _summarize(self, messages):
+        """Fold messages[self.summarized:] into the summary, one chunk per call."""
+        try:
+            while self.summarized < len(messages):
+                end = self.summarized
+                tokens = 0
+                while end < len(messages) and (end == self.summarized or tokens + message_tokens(messages[end]) <= self.chunk_tokens):
+                    tokens += message_tokens(messages[end])
+                    end += 1
+
+                summary = await self.summarize(self.summary, messages[self.summarized:end])
+                if not summary:
+                    return
+                self.summary = summary
+                self.summarized = end
+                debug(f"Summarized {end} messages into {estimate_tokens(summary)} tokens")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error(f"Failed to summarize conversation: {e}")
+
+    def cancel(self):
+        """Cancel a running summarization."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
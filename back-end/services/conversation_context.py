@@ -0,0 +1,35 @@
+"""Per-conversation state for the STT -> LLM -> TTS pipeline."""
+import config
+from models.database_models import DEFAULT_SESSION_ID
+from resources.prompts import SYSTEM_PROMPT
+
+
+class ConversationContext:
+    """State carried through one request of a conversation.
+
+    The conversation history and recent transcripts are shared by every request
+    of the same conversation, while the speaker belongs to the request, so
+    concurrent requests never overwrite each other's settings on the shared
+    service objects.
+    """
+
+    def __init__(self, session_id=DEFAULT_SESSION_ID, speaker=None, messages=None, transcripts=None):
+        """Initialize the context."""
+        self.session_id = session_id
+        self.speaker = speaker or config.TTS_SPEAKER
+        self.messages = messages if messages is not None else [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            }
+        ]
+        self.transcripts = transcripts if transcripts is not None else []
+
+    def for_request(self, speaker=None, transcripts=None, messages=None, session_id=None):
+        """Create a context for one request, sharing this conversation's history unless given one."""
+        return ConversationContext(
+            session_id=session_id or self.session_id,
+            speaker=speaker or self.speaker,
+            messages=self.messages if messages is None else messages,
+            transcripts=self.transcripts if transcripts is None else transcripts
+        )
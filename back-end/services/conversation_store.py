@@ -0,0 +1,143 @@
+"""Conversation history of each session, shared by every worker process through the database."""
+import asyncio
+import json
+from collections import OrderedDict
+import config
+from models.database_models import DEFAULT_SESSION_ID
+from services.context_window import ContextWindow
+from resources.prompts import SYSTEM_PROMPT
+
+
+def to_chat_message(role, content):
+    """Turn a stored message into an LLM chat message, or None if it carries no text."""
+    if role == "assistant":
+        # Assistant replies are stored as {"english": ..., "chinese": ...}; the LLM sees the English
+        try:
+            content = json.loads(content)
+        except (TypeError, json.JSONDecodeError):
+            pass
+        if isinstance(content, dict):
+            content = content.get("english", "")
+    if role not in ("user", "assistant") or not isinstance(content, str) or not content.strip():
+        return None
+    return {"role": role, "content": content}
+
+
+class SessionHistory:
+    """Chat messages of one session read so far, and the last message ID seen."""
+
+    def __init__(self, summarize=None):
+        """Initialize an empty history."""
+        self.messages = []
+        self.last_id = 0
+        self.lock = asyncio.Lock()
+        # Bounds the prompt built from the messages, with a summary of the older ones
+        self.window = ContextWindow(summarize)
+        # Whisper prompt context; only this process's own transcriptions, not synced
+        self.transcripts = []
+
+
+class ConversationStore:
+    """Read per-session conversation history from the database with a per-process LRU cache.
+
+    The database is the source of truth, so every worker process, and every
+    host sharing the database, sees the same history. Each process keeps the
+    chat messages of its ``max_sessions`` most recently used sessions and,
+    before each turn, fetches only the rows stored since then by any process,
+    using the increasing message ID. A session that is not cached is loaded in
+    full through the ``(session_id, id)`` index.
+
+    The history handed to the LLM is cut to each session's context window;
+    ``summarize`` (see ContextWindow) folds older turns into a summary kept
+    with the cached session.
+    """
+
+    def __init__(self, db_service, max_sessions=config.SESSION_CACHE_SIZE, summarize=None):
+        """Initialize the store."""
+        self.db_service = db_service
+        self.max_sessions = max_sessions
+        self.summarize = summarize
+        self._sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _get(self, session_id):
+        """Return the cached history of a session, creating it (and evicting the oldest) on a miss."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return session
+        self.misses += 1
+        session = self._sessions[session_id] = SessionHistory(self.summarize)
+        while len(self._sessions) > self.max_sessions:
+            # A turn still holding the evicted entry keeps working on it; the next turn reloads
+            _, evicted = self._sessions.popitem(last=False)
+            evicted.window.cancel()
+        return session
+
+    async def _sync(self, session_id, session):
+        async with session.lock:
+            rows = await asyncio.to_thread(self.db_service.load_messages_after, session.last_id, session_id)
+            for row in rows:
+                message = to_chat_message(row["role"], row["content"])
+                if message:
+                    session.messages.append(message)
+                session.last_id = max(session.last_id, row["id"])
+            return len(rows)
+
+    async def refresh(self, session_id=DEFAULT_SESSION_ID):
+        """Fetch the session's messages stored since the last refresh and return how many rows were read."""
+        return await self._sync(session_id, self._get(session_id))
+
+    async def probe(self, session_id=DEFAULT_SESSION_ID):
+        """Check that the session's history can be read, raising when the database cannot be queried.
+
+        Unlike ``refresh``, this leaves the cache order and hit counts alone and
+        does not add an uncached session; a cached one is still brought up to date.
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            await self._sync(session_id, session)
+        else:
+            await asyncio.to_thread(self.db_service.load_messages_after, 0, session_id, 1)
+
+    async def history(self, session_id=DEFAULT_SESSION_ID):
+        """Return the session's up-to-date history for the prompt, starting with the system prompt.
+
+        Only the context window is returned: the summary of older turns and the
+        most recent messages. The list belongs to the caller: the LLM service
+        appends the new turn to it, while the turn itself reaches other
+        requests through the database.
+        """
+        session = self._get(session_id)
+        await self._sync(session_id, session)
+        return session.window.build({"role": "system", "content": SYSTEM_PROMPT}, session.messages)
+
+    def transcripts(self, session_id=DEFAULT_SESSION_ID):
+        """Return the session's recent transcripts, used as the Whisper prompt."""
+        session = self._sessions.get(session_id)
+        return session.transcripts if session is not None else self._get(session_id).transcripts
+
+    def invalidate(self, session_id):
+        """Drop a session from the cache, e.g. after its messages were deleted."""
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.window.cancel()
+
+    def close(self):
+        """Cancel running summarizations."""
+        for session in self._sessions.values():
+            session.window.cancel()
+
+    def stats(self):
+        """Return cache size and hit counts."""
+        return {
+            "cached_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses
+        }
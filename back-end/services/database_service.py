@@ -1,10 +1,12 @@
 """Database service for chat history."""
-from models.database_models import init_db, Message, AudioSegment, MergedAudio
+from models.database_models import init_db, Message, AudioSegment, MergedAudio, DEFAULT_SESSION_ID
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 import json
 import os
 from datetime import datetime
 import logging
+import threading
 import uuid
 import traceback
 
@@ -14,10 +16,36 @@ class DatabaseService:
     """数据库服务，使用SQLAlchemy ORM处理数据库操作"""
     
     def __init__(self, db_path="data/messages.db"):
-        """初始化数据库服务"""
+        """初始化数据库服务；引擎和表结构在首次使用时创建，不拖慢进程启动"""
         self.db_path = db_path
-        self.engine, self.SessionLocal = init_db(db_path)
-        logging.info(f"数据库服务初始化: {db_path}")
+        self._engine = None
+        self._session_factory = None
+        self._init_lock = threading.Lock()
+    
+    def _ensure_initialized(self):
+        """创建数据库引擎和表结构（只执行一次，线程安全）"""
+        if self._session_factory is None:
+            with self._init_lock:
+                if self._session_factory is None:
+                    self._engine, self._session_factory = init_db(self.db_path)
+                    logging.info(f"数据库服务初始化: {self.db_path}")
+        return self._session_factory
+    
+    @property
+    def engine(self):
+        """数据库引擎"""
+        self._ensure_initialized()
+        return self._engine
+    
+    @property
+    def SessionLocal(self):
+        """会话工厂"""
+        return self._ensure_initialized()
+    
+    def ping(self):
+        """检查数据库是否可用，不可用时抛出异常"""
+        with self.SessionLocal() as db:
+            db.execute(text("SELECT 1"))
         
     def get_db(self):
         """获取数据库会话"""
@@ -27,15 +55,16 @@ class DatabaseService:
         finally:
             db.close()
     
-    def save_message(self, role, content):
-        """保存消息"""
+    def save_message(self, role, content, message_id=None, session_id=DEFAULT_SESSION_ID):
+        """保存消息到指定会话"""
         try:
-            message_id = str(uuid.uuid4())
+            message_id = message_id or str(uuid.uuid4())
             key = f"{role}-{message_id}"
             
             # 创建消息对象
             message = Message(
                 key=key,
+                session_id=session_id,
                 role=role,
                 message_id=message_id,
                 content=json.dumps(content) if not isinstance(content, str) else content,
@@ -55,8 +84,8 @@ class DatabaseService:
             logging.error(traceback.format_exc())
             return None
     
-    def save_message_with_audio(self, role, content, message_id, audio_paths=None):
-        """保存消息并关联音频路径"""
+    def save_message_with_audio(self, role, content, message_id, audio_paths=None, session_id=DEFAULT_SESSION_ID):
+        """保存消息并关联音频路径；消息不存在时在指定会话中创建"""
         try:
             key = f"{role}-{message_id}"
             
@@ -67,6 +96,7 @@ class DatabaseService:
                 if not message:
                     message = Message(
                         key=key,
+                        session_id=session_id,
                         role=role,
                         message_id=message_id,
                         content=json.dumps(content) if not isinstance(content, str) else content,
@@ -104,7 +134,7 @@ class DatabaseService:
     def update_message_audio(self, message_id, audio_paths, merged_info):
         """更新消息的音频信息"""
 
-        print(f"message_id, audio_paths, merged_info: {message_id}, {audio_paths}, {merged_info}")
+        logging.debug(f"更新消息音频: {message_id}, {len(audio_paths)}段, 合并信息: {merged_info}")
         try:
             with self.SessionLocal() as db:
                 # 尝试多种方式查找消息
@@ -171,6 +201,27 @@ class DatabaseService:
             logging.error(traceback.format_exc())
             return False
     
+    def update_message_content(self, message_id, content):
+        """更新消息内容（例如补充延迟完成的翻译）"""
+        try:
+            with self.SessionLocal() as db:
+                message = db.query(Message).filter(Message.message_id == message_id).first()
+                
+                if not message:
+                    logging.error(f"未找到消息: {message_id}")
+                    return False
+                
+                message.content = json.dumps(content) if not isinstance(content, str) else content
+                db.commit()
+            
+            logging.debug(f"已更新消息内容: {message_id}")
+            return True
+            
+        except Exception as e:
+            logging.error(f"更新消息内容失败: {e}")
+            logging.error(traceback.format_exc())
+            return False
+    
     def get_message_by_id(self, message_id):
         """根据消息ID查询消息"""
         try:
@@ -218,6 +269,19 @@ class DatabaseService:
             logging.error(traceback.format_exc())
             return []
     
+    def load_messages_after(self, after_id=0, session_id=DEFAULT_SESSION_ID, limit=None):
+        """按ID顺序加载会话中ID大于after_id的消息（只取对话需要的列），用于增量同步历史记录；limit限制最多返回的条数"""
+        with self.SessionLocal() as db:
+            query = (
+                db.query(Message.id, Message.role, Message.content)
+                .filter(Message.session_id == session_id, Message.id > after_id)
+                .order_by(Message.id)
+            )
+            if limit:
+                query = query.limit(limit)
+            rows = query.all()
+            return [{"id": row.id, "role": row.role, "content": row.content} for row in rows]
+    
     def get_session_history(self):
         """获取所有会话历史"""
         try:
@@ -237,21 +301,61 @@ class DatabaseService:
             logging.error(traceback.format_exc())
             return []
     
-    def clear_session(self):
-        """清空当前会话"""
+    def list_sessions(self):
+        """列出所有会话及其消息数和时间范围，最近活跃的在前"""
+        with self.SessionLocal() as db:
+            rows = (
+                db.query(
+                    Message.session_id,
+                    func.count(Message.id).label("message_count"),
+                    func.min(Message.timestamp).label("created_at"),
+                    func.max(Message.timestamp).label("updated_at")
+                )
+                .group_by(Message.session_id)
+                .order_by(func.max(Message.id).desc())
+                .all()
+            )
+            return [
+                {
+                    "session_id": row.session_id,
+                    "message_count": row.message_count,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "updated_at": row.updated_at.isoformat() if row.updated_at else None
+                }
+                for row in rows
+            ]
+    
+    def get_session_messages(self, session_id=DEFAULT_SESSION_ID, limit=None):
+        """获取一个会话的消息（含音频信息），按顺序排列；指定limit时只取最近的limit条"""
+        with self.SessionLocal() as db:
+            query = db.query(Message).filter(Message.session_id == session_id)
+            if limit:
+                messages = query.order_by(Message.id.desc()).limit(limit).all()[::-1]
+            else:
+                messages = query.order_by(Message.id).all()
+            return [message.to_dict() for message in messages]
+    
+    def clear_session(self, session_id=None):
+        """清空指定会话；不指定session_id时清空所有会话，返回删除的消息数，失败时返回None"""
         try:
             with self.SessionLocal() as db:
-                # 删除所有消息及关联数据
-                db.query(AudioSegment).delete()
-                db.query(MergedAudio).delete()
-                db.query(Message).delete()
+                # 删除消息及关联数据
+                if session_id is None:
+                    db.query(AudioSegment).delete()
+                    db.query(MergedAudio).delete()
+                    deleted = db.query(Message).delete()
+                else:
+                    ids = db.query(Message.id).filter(Message.session_id == session_id)
+                    db.query(AudioSegment).filter(AudioSegment.message_id.in_(ids.scalar_subquery())).delete(synchronize_session=False)
+                    db.query(MergedAudio).filter(MergedAudio.message_id.in_(ids.scalar_subquery())).delete(synchronize_session=False)
+                    deleted = db.query(Message).filter(Message.session_id == session_id).delete(synchronize_session=False)
                 db.commit()
-            logging.info("会话已清空")
-            return True
+            logging.info(f"会话已清空: {session_id or '全部'}（{deleted}条消息）")
+            return deleted
         except Exception as e:
             logging.error(f"清空会话失败: {e}")
             logging.error(traceback.format_exc())
-            return False
+            return None
     
     def get_message_by_flexible_id(self, message_id):
         """灵活查询消息，尝试多种ID格式"""
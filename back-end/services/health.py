@@ -0,0 +1,82 @@
+"""Readiness checks for the assistant and the backends it depends on."""
+import asyncio
+import time
+import aiohttp
+import config
+
+
+class ReadinessChecker:
+    """Run named checks concurrently and report which ones pass.
+
+    A check is a coroutine function that returns a dict of details (or None)
+    and raises when the dependency is unavailable. Results are cached for
+    ``cache_seconds`` so frequent probes from a load balancer or orchestrator
+    do not turn into load on the backends.
+    """
+
+    def __init__(self, required=config.READINESS_REQUIRED_CHECKS,
+                 timeout=config.READINESS_TIMEOUT,
+                 cache_seconds=config.READINESS_CACHE_SECONDS):
+        """Initialize the checker."""
+        self.required = list(required)
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self._checks = {}
+        self._session = None  # Probe session, separate from the request pools
+        self._cached = None
+        self._cached_at = 0.0
+
+    def add(self, name, check):
+        """Register a check."""
+        self._checks[name] = check
+
+    def add_http(self, name, url):
+        """Register a check that passes when ``url`` answers with any status below 500.
+
+        The TTS and Whisper servers have no GET route, so a 404 or 405 still
+        shows the server is up.
+        """
+        async def probe():
+            async with self._get_session().get(url, allow_redirects=False) as response:
+                if response.status >= 500:
+                    raise RuntimeError(f"HTTP {response.status}")
+                return {"http_status": response.status}
+        self.add(name, probe)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """Close the probe session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _run(self, check):
+        start = time.monotonic()
+        try:
+            details = await asyncio.wait_for(check(), self.timeout)
+            result = {"status": "ok", **(details or {})}
+        except asyncio.TimeoutError:
+            result = {"status": "down", "error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "down", "error": str(e) or type(e).__name__}
+        result["latency_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return result
+
+    async def check(self):
+        """Return ``(ready, results)``; ready when every required check passes."""
+        if self._cached is not None and time.monotonic() - self._cached_at < self.cache_seconds:
+            return self._cached
+
+        names = list(self._checks)
+        results = dict(zip(names, await asyncio.gather(*(self._run(self._checks[name]) for name in names))))
+        for name, result in results.items():
+            result["required"] = name in self.required
+        ready = all(results[name]["status"] == "ok" for name in self.required if name in results)
+
+        self._cached = (ready, results)
+        self._cached_at = time.monotonic()
+        return self._cached
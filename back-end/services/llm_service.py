@@ -1,10 +1,16 @@
 """Large Language Model service."""
-import requests
+import aiohttp
+import asyncio
 import json
 import re
+import time
 from utils.logging_utils import debug, info, error
+from utils.text_utils import AdaptiveSegmenter
 import config
-from resources.prompts import SYSTEM_PROMPT
+from resources.prompts import SYSTEM_PROMPT, SUMMARY_PROMPT
+from services.context_window import ContextWindow
+from services.metrics import LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, TRANSLATION_SECONDS, SUMMARY_SECONDS, BACKEND_ERRORS
+from resources.responses import LLM_EMPTY, LLM_ERROR, MODEL_CONNECTION_ERROR, fallback_response
 
 class LLMService:
     """Service for interacting with Large Language Models."""
@@ -14,36 +20,77 @@ class LLMService:
         self.api_url = api_url
         self.model = model
         self.llm = None
+        self._session = None  # Shared aiohttp session, created on first use
+        self._semaphore = asyncio.Semaphore(config.LLM_MAX_CONCURRENCY)  # Bounds requests in flight to Ollama
         self.messages = [
             {
                 "role": "system",
                 "content": SYSTEM_PROMPT
             }
         ]
+        # Bounds the prompt built from self.messages; callers passing their own history bound it themselves
+        self.window = ContextWindow(self.summarize if config.LLM_SUMMARY_ENABLED else None)
         
-        # Check available models
-        self.available_models = self._get_available_models()
+        # Filled in by discover_models() during startup, so a slow or unreachable
+        # Ollama never delays the process; until then the configured model is used
+        self.available_models = []
+    
+    async def discover_models(self):
+        """Get the available models from Ollama, switching to one if the configured model is missing."""
+        try:
+            async with self._get_session().get(
+                f"{self.api_url}/api/tags", timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                if response.status != 200:
+                    error(f"Failed to get available models: {response.status}")
+                    return []
+                models = (await response.json()).get("models", [])
+        except Exception as e:
+            error(f"Error getting available models: {e}")
+            return []
+        
+        self.available_models = [model["name"] for model in models]
         if self.available_models:
             debug(f"Available models: {', '.join(self.available_models)}")
             
             # If configured model is not available, use the first available model
-            if self.model not in self.available_models and self.available_models:
+            if self.model not in self.available_models:
                 info(f"Model '{self.model}' not found. Using '{self.available_models[0]}' instead.")
                 self.model = self.available_models[0]
+        return self.available_models
     
-    def _get_available_models(self):
-        """Get list of available models from Ollama."""
-        try:
-            response = requests.get(f"{self.api_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return [model["name"] for model in models]
-            else:
-                error(f"Failed to get available models: {response.status_code}")
-                return []
-        except Exception as e:
-            error(f"Error getting available models: {e}")
-            return []
+    def _get_session(self):
+        """Get the shared keep-alive HTTP session for Ollama requests."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=config.LLM_POOL_SIZE,
+                    keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def _append_turn(self, history, user_input, assistant_content):
+        """Append a completed user/assistant exchange to a history list."""
+        history.append({"role": "user", "content": user_input})
+        if assistant_content and assistant_content.strip():
+            history.append({"role": "assistant", "content": assistant_content})
+    
+    def _request_messages(self, messages, user_input):
+        """Return the messages to send for a turn; this service's own history is cut to the context window."""
+        if messages is None:
+            history = self.window.build(self.messages[0], self.messages[1:])
+        else:
+            history = messages
+        # A new list, so concurrent requests never see each other half-done
+        return history + [{"role": "user", "content": user_input}]
     
     def add_message(self, role, content):
         """Add a message to the conversation history."""
@@ -55,101 +102,66 @@ class LLMService:
             "content": content
         })
     
-    def get_response(self, user_input):
-        """Get response from LLM."""
+    async def get_response(self, user_input, messages=None, translate=True):
+        """Get response from LLM.
+        
+        ``messages`` is the conversation history to use and update; it defaults
+        to this service's own history. With ``translate=False`` the Chinese
+        translation is left empty for the caller to request separately.
+        """
         if not user_input or not user_input.strip():
             return None
-            
-        # Add user message to history
-        self.add_message("user", user_input)
+        
+        history = self.messages if messages is None else messages
+        request_messages = self._request_messages(messages, user_input)
         
         # First, get a regular English response
         try:
             debug(f"Sending English request to Ollama API using model: {self.model}")
             
-            english_response = requests.post(
+            started = time.monotonic()
+            async with self._semaphore, self._get_session().post(
                 f"{self.api_url}/api/chat",
                 json={
                     "model": self.model,
-                    "messages": self.messages,
+                    "messages": request_messages,
                     "stream": False,
                     "options": {
                         "temperature": 0.7,
                         "top_p": 0.9,
                         "top_k": 40
                     }
-                },
-                timeout=60
-            )
+                }
+            ) as english_response:
+                status = english_response.status
+                if status == 200:
+                    result = await english_response.json(content_type=None)
+                else:
+                    error_text = await english_response.text()
+            
+            # 非流式请求的首个token即完整回复
+            elapsed = time.monotonic() - started
+            LLM_FIRST_TOKEN_SECONDS.labels(stream="false").observe(elapsed)
+            LLM_SECONDS.labels(stream="false").observe(elapsed)
             
-            if english_response.status_code == 200:
-                result = english_response.json()
+            if status == 200:
                 english_content = result.get("message", {}).get("content", "")
                 
                 if not english_content:
                     debug("Empty English response from LLM")
-                    english_content = "I'm sorry, I couldn't generate a proper response. Could you try asking again?"
+                    english_content = LLM_EMPTY["english"]
                 
                 # Clean up the English response for TTS (preserve punctuation)
                 english_content = self._clean_response(english_content)
                 
                 # Now, get a Chinese translation of the English response
-                translation_prompt = f"""
-Translate the following English text to Chinese. Provide only the Chinese translation without any additional text or explanations:
-
-"{english_content}"
-"""
-                
-                translation_messages = [
-                    {
-                        "role": "system",
-                        "content": "You are a helpful translator that translates English to Chinese accurately."
-                    },
-                    {
-                        "role": "user",
-                        "content": translation_prompt
-                    }
-                ]
-                
-                debug("Sending translation request to Ollama API")
-                
-                translation_response = requests.post(
-                    f"{self.api_url}/api/chat",
-                    json={
-                        "model": self.model,
-                        "messages": translation_messages,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,  # Lower temperature for more accurate translation
-                            "top_p": 0.9,
-                            "top_k": 40
-                        }
-                    },
-                    timeout=60
-                )
-                
-                chinese_content = ""
-                if translation_response.status_code == 200:
-                    translation_result = translation_response.json()
-                    chinese_content = translation_result.get("message", {}).get("content", "")
-                    
-                    # Clean up the translation
-                    chinese_content = chinese_content.strip()
-                    # Only remove surrounding quotes, not all punctuation
-                    chinese_content = re.sub(r'^["\'"]|["\'"]$', '', chinese_content)
-                    
-                    if not chinese_content:
-                        debug("Empty Chinese translation from LLM")
-                        chinese_content = "抱歉，我无法生成适当的回应。您能再试一次吗？"
-                else:
-                    debug(f"Translation API error: {translation_response.status_code}")
-                    chinese_content = "抱歉，我无法生成适当的回应。您能再试一次吗？"
+                chinese_content = await self.translate(english_content) if translate else ""
                 
                 # Add to conversation history (only the English part)
-                self.add_message("assistant", english_content)
+                self._append_turn(history, user_input, english_content)
                 
                 # Format the display message with both languages
-                display_message = f"{english_content}\n\n{chinese_content}"
+                display_message = f"{english_content}\n\n{chinese_content}" if chinese_content else english_content
                 
                 # Return a dictionary with both parts
                 return {
@@ -158,31 +170,224 @@ Translate the following English text to Chinese. Provide only the Chinese transl
                     "display": display_message
                 }
             else:
-                error(f"LLM API error: {english_response.status_code}")
-                debug(f"Error response: {english_response.text}")
+                error(f"LLM API error: {status}")
+                debug(f"Error response: {error_text}")
+                BACKEND_ERRORS.labels(backend="llm").inc()
                 
                 # Fallback response for API errors
-                fallback_response = {
-                    "english": f"I'm sorry, there was an error connecting to my language model ({self.model}). Please try again later.",
-                    "chinese": f"抱歉，连接到我的语言模型 ({self.model}) 时出现错误。请稍后再试。",
-                    "display": f"I'm sorry, there was an error connecting to my language model ({self.model}). Please try again later.\n\n抱歉，连接到我的语言模型 ({self.model}) 时出现错误。请稍后再试。"
-                }
-                
-                return fallback_response
+                return fallback_response(MODEL_CONNECTION_ERROR, model=self.model)
                 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             error(f"Failed to get LLM response: {e}")
+            BACKEND_ERRORS.labels(backend="llm").inc()
             import traceback
             debug(f"Exception details: {traceback.format_exc()}")
             
             # Fallback response for exceptions
-            fallback_response = {
-                "english": "I'm sorry, I encountered an error while processing your request. Please try again.",
-                "chinese": "抱歉，处理您的请求时遇到错误。请再试一次。",
-                "display": "I'm sorry, I encountered an error while processing your request. Please try again.\n\n抱歉，处理您的请求时遇到错误。请再试一次。"
+            return fallback_response(LLM_ERROR)
+    
+    async def stream_sentences(self, user_input, messages=None, segmenter=None):
+        """Stream the English response from LLM, yielding TTS segments of whole sentences.
+
+        Segments are cut by ``segmenter`` (an AdaptiveSegmenter by default) and
+        cleaned for TTS as they are cut. Once the stream ends the turn is added
+        to the conversation history (``messages``, defaulting to this service's
+        own history).
+        """
+        if not user_input or not user_input.strip():
+            return
+        
+        history = self.messages if messages is None else messages
+        request_messages = self._request_messages(messages, user_input)
+        
+        sentences = []
+        try:
+            debug(f"Sending streaming English request to Ollama API using model: {self.model}")
+            
+            started = time.monotonic()
+            first_token = True
+            async with self._semaphore, self._get_session().post(
+                f"{self.api_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": request_messages,
+                    "stream": True,
+                    "options": {
+                        "temperature": 0.7,
+                        "top_p": 0.9,
+                        "top_k": 40
+                    }
+                }
+            ) as response:
+                if response.status != 200:
+                    error(f"LLM API error: {response.status}")
+                    debug(f"Error response: {await response.text()}")
+                    BACKEND_ERRORS.labels(backend="llm").inc()
+                    sentences.append(MODEL_CONNECTION_ERROR["english"].format(model=self.model))
+                    yield sentences[-1]
+                    return
+                
+                splitter = segmenter or AdaptiveSegmenter()
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("message", {}).get("content", "")
+                    if token and first_token:
+                        first_token = False
+                        LLM_FIRST_TOKEN_SECONDS.labels(stream="true").observe(time.monotonic() - started)
+                    
+                    for sentence in splitter.feed(token):
+                        sentence = self._clean_response(sentence)
+                        if sentence:
+                            sentences.append(sentence)
+                            yield sentence
+                    
+                    if chunk.get("done"):
+                        break
+                
+                for sentence in splitter.flush():
+                    sentence = self._clean_response(sentence)
+                    if sentence:
+                        sentences.append(sentence)
+                        yield sentence
+                
+                LLM_SECONDS.labels(stream="true").observe(time.monotonic() - started)
+            
+            if not sentences:
+                debug("Empty English response from LLM")
+                sentences.append(LLM_EMPTY["english"])
+                yield sentences[-1]
+                
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error(f"Failed to stream LLM response: {e}")
+            BACKEND_ERRORS.labels(backend="llm").inc()
+            import traceback
+            debug(f"Exception details: {traceback.format_exc()}")
+            
+            if not sentences:
+                sentences.append(LLM_ERROR["english"])
+                yield sentences[-1]
+        finally:
+            # Add to conversation history (only the English part)
+            if sentences:
+                self._append_turn(history, user_input, " ".join(sentences))
+    
+    async def translate(self, english_content):
+        """Translate an English response to Chinese."""
+        translation_prompt = f"""
+Translate the following English text to Chinese. Provide only the Chinese translation without any additional text or explanations:
+
+"{english_content}"
+"""
+        
+        translation_messages = [
+            {
+                "role": "system",
+                "content": "You are a helpful translator that translates English to Chinese accurately."
+            },
+            {
+                "role": "user",
+                "content": translation_prompt
             }
+        ]
+        
+        debug("Sending translation request to Ollama API")
+        
+        started = time.monotonic()
+        try:
+            async with self._semaphore, self._get_session().post(
+                f"{self.api_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": translation_messages,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.3,  # Lower temperature for more accurate translation
+                        "top_p": 0.9,
+                        "top_k": 40
+                    }
+                }
+            ) as translation_response:
+                status = translation_response.status
+                if status == 200:
+                    translation_result = await translation_response.json(content_type=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error(f"Failed to get translation: {e}")
+            BACKEND_ERRORS.labels(backend="translation").inc()
+            return LLM_EMPTY["chinese"]
+        
+        TRANSLATION_SECONDS.observe(time.monotonic() - started)
+        
+        chinese_content = ""
+        if status == 200:
+            chinese_content = translation_result.get("message", {}).get("content", "")
+            
+            # Clean up the translation
+            chinese_content = chinese_content.strip()
+            # Only remove surrounding quotes, not all punctuation
+            chinese_content = re.sub(r'^["\'"]|["\'"]$', '', chinese_content)
             
-            return fallback_response
+            if not chinese_content:
+                debug("Empty Chinese translation from LLM")
+                chinese_content = LLM_EMPTY["chinese"]
+        else:
+            debug(f"Translation API error: {status}")
+            BACKEND_ERRORS.labels(backend="translation").inc()
+            chinese_content = LLM_EMPTY["chinese"]
+        
+        return chinese_content
+    
+    async def summarize(self, summary, messages):
+        """Fold conversation messages into a running summary, returning None on failure."""
+        conversation = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        summary_messages = [
+            {
+                "role": "system",
+                "content": SUMMARY_PROMPT
+            },
+            {
+                "role": "user",
+                "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{conversation}"
+            }
+        ]
+        
+        debug(f"Sending summary request to Ollama API for {len(messages)} messages")
+        
+        started = time.monotonic()
+        try:
+            async with self._semaphore, self._get_session().post(
+                f"{self.api_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": summary_messages,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.3,
+                        "num_predict": config.LLM_SUMMARY_TOKENS
+                    }
+                }
+            ) as summary_response:
+                if summary_response.status != 200:
+                    error(f"Summary API error: {summary_response.status}")
+                    BACKEND_ERRORS.labels(backend="summary").inc()
+                    return None
+                result = await summary_response.json(content_type=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error(f"Failed to get summary: {e}")
+            BACKEND_ERRORS.labels(backend="summary").inc()
+            return None
+        
+        SUMMARY_SECONDS.observe(time.monotonic() - started)
+        return result.get("message", {}).get("content", "").strip() or None
     
     def _extract_bilingual_parts(self, text):
         """Extract English and Chinese parts from the response."""
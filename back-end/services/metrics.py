@@ -0,0 +1,115 @@
+"""Prometheus metrics for the STT -> LLM -> TTS pipeline."""
+import os
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Set by main() when serving with several worker processes: each worker writes its
+# samples to files in this directory, and /metrics merges them
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# Seconds; covers cache hits (milliseconds) up to backend timeouts (60 s)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0, 60.0)
+
+# Encoding and disk writes are much faster than backend calls
+IO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+STT_SECONDS = Histogram(
+    "weebo_stt_seconds", "Whisper transcription time", buckets=LATENCY_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "weebo_llm_first_token_seconds", "Time from sending the LLM request to the first token",
+    ["stream"], buckets=LATENCY_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "weebo_llm_seconds", "Total LLM response time", ["stream"], buckets=LATENCY_BUCKETS
+)
+TRANSLATION_SECONDS = Histogram(
+    "weebo_translation_seconds", "Chinese translation time", buckets=LATENCY_BUCKETS
+)
+SUMMARY_SECONDS = Histogram(
+    "weebo_summary_seconds", "Time to fold older turns into a conversation summary", buckets=LATENCY_BUCKETS
+)
+LLM_HISTORY_TOKENS = Histogram(
+    "weebo_llm_history_tokens", "Estimated tokens of history (system prompt, summary and recent turns) sent per LLM request",
+    buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+TTS_SEGMENT_SECONDS = Histogram(
+    "weebo_tts_segment_seconds", "Time to synthesize one segment, including cache hits",
+    buckets=LATENCY_BUCKETS
+)
+TTS_REQUESTS = Counter(
+    "weebo_tts_requests_total", "Segment synthesis requests by where the audio came from", ["source"]
+)
+AUDIO_ENCODE_SECONDS = Histogram(
+    "weebo_audio_encode_seconds", "Time to encode one segment", ["format"], buckets=IO_BUCKETS
+)
+AUDIO_WRITE_SECONDS = Histogram(
+    "weebo_audio_write_seconds", "Time to write audio to disk on the writer thread", ["kind"],
+    buckets=IO_BUCKETS
+)
+TIME_TO_FIRST_AUDIO_SECONDS = Histogram(
+    "weebo_time_to_first_audio_seconds", "Time from receiving a request to sending its first audio",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "weebo_admission_queue_seconds", "Time a request waited for a pipeline slot", buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT_REQUESTS = Gauge(
+    "weebo_in_flight_requests", "Requests currently being processed", ["endpoint"],
+    multiprocess_mode="livesum"
+)
+BACKEND_ERRORS = Counter(
+    "weebo_backend_errors_total", "Failed calls to backend services", ["backend"]
+)
+
+
+class TTSCacheCollector:
+    """Expose TTSCache.stats() at scrape time."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+
+        hits = CounterMetricFamily("weebo_tts_cache_hits", "TTS cache hits by tier", labels=["tier"])
+        hits.add_metric(["memory"], stats["hits_memory"])
+        hits.add_metric(["disk"], stats["hits_disk"])
+        yield hits
+
+        yield CounterMetricFamily("weebo_tts_cache_misses", "TTS cache misses", value=stats["misses"])
+
+        size = GaugeMetricFamily("weebo_tts_cache_bytes", "TTS cache size by tier", labels=["tier"])
+        size.add_metric(["memory"], stats["memory_bytes"])
+        size.add_metric(["disk"], stats["disk_bytes"])
+        yield size
+
+        yield GaugeMetricFamily(
+            "weebo_tts_cache_memory_entries", "Entries in the in-memory TTS cache", value=stats["memory_entries"]
+        )
+
+
+def register_tts_cache(cache):
+    """Publish the TTS cache counters alongside the pipeline metrics.
+
+    Custom collectors cannot be merged across processes, so with several
+    workers the cache counters are only available per process from
+    /tts_cache/stats.
+    """
+    if cache is not None and not MULTIPROCESS:
+        REGISTRY.register(TTSCacheCollector(cache))
+
+
+def render():
+    """Render the metrics in the Prometheus text format, merged across worker processes."""
+    if not MULTIPROCESS:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of a worker process that is exiting."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
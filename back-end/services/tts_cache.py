@@ -0,0 +1,152 @@
+"""Content-addressed cache for synthesized speech."""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from utils.logging_utils import debug, error
+import config
+
+
+class TTSCache:
+    """Two-tier cache of TTS audio keyed by a hash of the request parameters.
+
+    Audio bytes are kept in a bounded in-memory LRU and in a directory on disk
+    whose total size is bounded; the oldest files are evicted first. TTS output
+    is deterministic for a fixed seed, so identical requests can be served
+    without calling the TTS server.
+    """
+
+    def __init__(self, cache_dir=config.TTS_CACHE_DIR,
+                 max_memory_bytes=config.TTS_CACHE_MEMORY_BYTES,
+                 max_disk_bytes=config.TTS_CACHE_DISK_BYTES):
+        """Initialize the cache and index the files already on disk."""
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if self.max_disk_bytes > 0:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with os.scandir(self.cache_dir) as entries:
+                self._disk_bytes = sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+    @staticmethod
+    def make_key(request_data):
+        """Hash the TTS request parameters (text, speaker, generation settings)."""
+        payload = json.dumps(request_data, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    async def get(self, key):
+        """Return cached audio bytes for ``key``, or None on a miss."""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return data
+
+        if self.max_disk_bytes > 0:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.hits_disk += 1
+                self._put_memory(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, data):
+        """Store audio bytes in both tiers."""
+        if not data:
+            return
+        self._put_memory(key, data)
+        if self.max_disk_bytes > 0:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Refresh the modification time so eviction stays least-recently-used
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            error(f"Failed to read TTS cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._path(key)
+        try:
+            if os.path.exists(path):
+                return
+            tmp_path = f"{path}.{os.getpid()}.tmp"  # Unique per worker process sharing the directory
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._disk_lock:
+                self._disk_bytes += len(data)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+        except Exception as e:
+            error(f"Failed to write TTS cache entry {key}: {e}")
+
+    def _evict_disk(self):
+        """Delete the least recently used files until under the size limit."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._disk_bytes <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+            except FileNotFoundError:
+                self._disk_bytes -= size
+            except Exception as e:
+                error(f"Failed to evict TTS cache file {path}: {e}")
+        debug(f"TTS disk cache evicted down to {self._disk_bytes} bytes")
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes."""
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes
+        }
@@ -0,0 +1,25 @@
+import asyncio
+
+from services.conversation_store import ConversationStore
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = [{"id": 1, "role": "user", "content": "hello"}]
+
+    def load_messages_after(self, after_id=0, session_id="default", limit=None):
+        rows = [row for row in self.rows if row["id"] > after_id]
+        return rows[:limit] if limit else rows
+
+
+def test_probe_leaves_the_cache_alone():
+    async def run():
+        store = ConversationStore(FakeDatabase(), max_sessions=1)
+        await store.refresh("a")
+        await store.probe("b")
+        await store.probe("a")
+        return store
+
+    store = asyncio.run(run())
+    assert list(store._sessions) == ["a"]
+    assert (store.hits, store.misses) == (0, 1)
@@ -0,0 +1,26 @@
+import json
+import logging
+import queue
+import sys
+
+from utils.logging_utils import ExceptionQueueHandler, JSONFormatter
+
+
+def make_record():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        return logging.LogRecord("test", logging.ERROR, __file__, 1, "failed %s", ("here",), sys.exc_info())
+
+
+def test_json_formatter_fills_exception():
+    entry = json.loads(JSONFormatter().format(make_record()))
+    assert entry["message"] == "failed here"
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_exception_survives_the_log_queue():
+    record = ExceptionQueueHandler(queue.SimpleQueue()).prepare(make_record())
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry["message"] == "failed here"
+    assert "ValueError: broken" in entry["exception"]
@@ -0,0 +1,17 @@
+from utils.text_utils import AdaptiveSegmenter, _hard_split, segment_sizes_for_throughput
+
+
+def test_hard_split_marks_pieces_cut_inside_a_word():
+    assert _hard_split("abcdefghijk", 8) == [("abcdefgh", False), ("ijk", True)]
+
+
+def test_segmenter_joins_a_word_cut_apart_without_a_space():
+    segmenter = AdaptiveSegmenter(first_length=8, growth=1.0, max_length=8, min_length=4, fill=2.0)
+    segments = segmenter.split("abcdefghijk")
+    assert "".join(segments) == "abcdefghijk"
+
+
+def test_first_segment_keeps_a_whole_sentence_when_overhead_exceeds_target():
+    sizes = segment_sizes_for_throughput(1.5, 40.0, target_first_audio_seconds=1.0)
+    segments = AdaptiveSegmenter(**sizes).split("This is reply number 3. Hello there, my dear!")
+    assert segments[0].startswith("This is reply number 3.")
@@ -0,0 +1,33 @@
+"""Tests for the TTS client's handling of pre-rendered canned audio."""
+import asyncio
+import numpy as np
+import config
+from models.tts_model import TextToSpeechModel
+from resources.responses import canned_english_texts
+
+
+def make_model(monkeypatch):
+    monkeypatch.setattr(config, "TTS_CACHE_ENABLED", False)
+    return TextToSpeechModel(api_url="http://127.0.0.1:9/tts")  # Unreachable: any server call fails
+
+
+def test_default_speaker_gets_prerendered_canned_audio(monkeypatch):
+    model = make_model(monkeypatch)
+    audio = (np.zeros(240, dtype=np.float32), 24000)
+
+    async def fake_synthesis(text, speaker=None):
+        return audio
+    monkeypatch.setattr(model, "_generate_audio_for_text", fake_synthesis)
+    text = canned_english_texts(model="phi4:latest")[0]
+    asyncio.run(model.prerender([text], config.TTS_PRERENDER_SPEAKERS))
+    monkeypatch.undo()  # Real synthesis path again: only the canned audio can answer
+
+    assert model.split(text, "default") == [text]
+    assert asyncio.run(model.generate_audio_segment(text, "default")) is audio
+
+
+def test_named_speaker_is_kept():
+    model = TextToSpeechModel.__new__(TextToSpeechModel)
+    model.speaker = config.TTS_SPEAKER
+    assert model.resolve_speaker("af_sky") == "af_sky"
+    assert model.resolve_speaker(None) == config.TTS_SPEAKER
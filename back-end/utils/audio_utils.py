@@ -34,9 +34,7 @@ def resample_audio(audio_data, src_sample_rate, target_sample_rate):
         if audio_data.dtype != np.float32:
             audio_data = audio_data.astype(np.float32)
         
-        # Simple resampling using scipy
-        from scipy import signal
-        
+        # Linear interpolation; importing scipy here cost over a second on the first request
         duration = len(audio_data) / src_sample_rate
         time_old = np.linspace(0, duration, len(audio_data))
         time_new = np.linspace(0, duration, int(len(audio_data) * target_sample_rate / src_sample_rate))
@@ -140,4 +138,53 @@ def split_audio_at_silence(audio_data, sample_rate=24000):
         return [seg for seg in segments if len(seg) > 0.1 * sample_rate]  # Filter out very short segments
     except Exception as e:
         error(f"Audio splitting error: {e}")
-        return [audio_data]
\ No newline at end of file
+        return [audio_data]
+
+
+# Codecs for streamed and stored speech: (soundfile format, subtype, MIME type, file extension)
+AUDIO_FORMATS = {
+    "wav": ("WAV", "PCM_16", "audio/wav", "wav"),
+    "opus": ("OGG", "OPUS", "audio/ogg; codecs=opus", "ogg"),
+    "flac": ("FLAC", "PCM_16", "audio/flac", "flac"),
+}
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def negotiate_audio_format(requested, default="wav"):
+    """Pick a supported audio format from a client request, falling back to the default."""
+    if requested:
+        requested = requested.lower().strip()
+        if requested in ("ogg", "audio/ogg"):
+            requested = "opus"
+        if requested in AUDIO_FORMATS:
+            return requested
+        debug(f"Unsupported audio format '{requested}', using {default}")
+    return default
+
+
+def encode_audio(audio_data, sample_rate, audio_format="wav"):
+    """Encode mono audio to bytes in the given format. Returns (bytes, sample rate)."""
+    file_format, subtype, _, _ = AUDIO_FORMATS[audio_format]
+    
+    if audio_data.dtype != np.float32 and audio_data.dtype != np.int16:
+        audio_data = audio_data.astype(np.float32)
+    
+    # Opus only supports a few sample rates (e.g. not 44.1 kHz)
+    if audio_format == "opus" and sample_rate not in OPUS_SAMPLE_RATES:
+        if audio_data.dtype == np.int16:
+            audio_data = audio_data.astype(np.float32) / 32768.0
+        audio_data = resample_audio(audio_data, sample_rate, 48000).astype(np.float32)
+        sample_rate = 48000
+    
+    buffer = io.BytesIO()
+    sf.write(buffer, audio_data, sample_rate, format=file_format, subtype=subtype)
+    return buffer.getvalue(), sample_rate
+
+
+def transcode_audio(audio_bytes, audio_format):
+    """Re-encode an in-memory audio file (e.g. WAV) to the given format. Returns (bytes, sample rate)."""
+    with io.BytesIO(audio_bytes) as audio_io:
+        audio_data, sample_rate = sf.read(audio_io, dtype="float32")
+    if audio_data.ndim > 1:
+        audio_data = np.mean(audio_data, axis=1)
+    return encode_audio(audio_data, sample_rate, audio_format)
@@ -0,0 +1,114 @@
+"""Background audio file writing."""
+import asyncio
+import io
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from utils.logging_utils import error
+from services.metrics import AUDIO_WRITE_SECONDS
+
+# A single writer thread keeps file writes ordered and off the event loop
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-writer")
+
+
+def _write_bytes(path, data):
+    with AUDIO_WRITE_SECONDS.labels(kind="segment").time(), open(path, "wb") as f:
+        f.write(data)
+
+
+def submit_file_write(path, data):
+    """Queue a file write on the background writer thread."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_executor, _write_bytes, path, data)
+
+
+class MergedAudioWriter:
+    """Append WAV segments to a single WAV file as they are produced.
+
+    Frames are streamed to disk on the writer thread; the RIFF header sizes are
+    fixed up by ``wave`` when the file is closed.
+    """
+
+    def __init__(self, path):
+        """Initialize the writer. The file is created on the first append."""
+        self.path = path
+        self.params = None  # (channels, sample width, sample rate)
+        self.frames = 0
+        self._wav = None
+        self._failed = False
+        self._closed = False
+
+    @property
+    def sample_rate(self):
+        """Sample rate of the merged file, or None before the first segment."""
+        return self.params[2] if self.params else None
+
+    def append_wav(self, wav_bytes):
+        """Queue the frames of an in-memory WAV segment for appending."""
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as segment:
+            params = (segment.getnchannels(), segment.getsampwidth(), segment.getframerate())
+            frames = segment.readframes(segment.getnframes())
+
+        if self.params is None:
+            self.params = params
+        elif params != self.params:
+            error(f"Segment format {params} does not match merged audio {self.params}, skipping")
+            return
+
+        self.frames += len(frames) // (params[0] * params[1])
+        asyncio.get_running_loop().run_in_executor(_executor, self._append, frames)
+
+    def _append(self, frames):
+        if self._failed:
+            return
+        try:
+            if self._wav is None:
+                self._wav = wave.open(self.path, 'wb')
+                self._wav.setnchannels(self.params[0])
+                self._wav.setsampwidth(self.params[1])
+                self._wav.setframerate(self.params[2])
+            with AUDIO_WRITE_SECONDS.labels(kind="merged").time():
+                self._wav.writeframesraw(frames)
+        except Exception as e:
+            self._failed = True
+            error(f"Failed to append merged audio {self.path}: {e}")
+
+    def _close(self):
+        if self._wav is None:
+            return False
+        try:
+            self._wav.close()
+        except Exception as e:
+            self._failed = True
+            error(f"Failed to finalize merged audio {self.path}: {e}")
+        return not self._failed
+
+    def _discard(self):
+        self._failed = True
+        if self._wav is None:
+            return
+        try:
+            self._wav.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            error(f"Failed to remove merged audio {self.path}: {e}")
+
+    def discard(self):
+        """Abandon the file: drop pending frames and delete what was written.
+
+        Does nothing once ``close`` was called, so it can run on every exit path.
+        """
+        if self._closed:
+            return
+        self._failed = True
+        _executor.submit(self._discard)
+
+    async def close(self):
+        """Flush pending writes and finalize the file. Returns True on success."""
+        self._closed = True
+        return await asyncio.get_running_loop().run_in_executor(_executor, self._close)
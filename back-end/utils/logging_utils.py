@@ -1,62 +1,142 @@
-"""Logging utilities."""
+"""Logging utilities.
+
+Records are put on a queue by the calling thread and written to stderr by a
+background listener thread, so logging never blocks the event loop on a slow
+terminal or pipe. Every record carries the ID of the request it belongs to.
+"""
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import uuid
+import config
 from config import PINK, CYAN, YELLOW, NEON_GREEN, RESET_COLOR
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# ID of the request being handled; copied into tasks and to_thread calls it starts
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+
+def new_request_id(request_id=None):
+    """Set the current request ID (a new one unless given) and return it."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request ID to every record."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class ExceptionQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps a record's traceback apart from its message.
+
+    The stock handler folds the traceback into the message and drops
+    ``exc_info``; this one renders it into ``exc_text`` on the calling thread,
+    so formatters on the listener thread can still place it themselves.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines, colored like the chat transcript."""
+
+    LEVEL_COLORS = {logging.DEBUG: YELLOW, logging.WARNING: YELLOW, logging.ERROR: PINK, logging.CRITICAL: PINK}
+
+    def format(self, record):
+        line = super().format(record)
+        color = self.LEVEL_COLORS.get(record.levelno)
+        return f"{color}{line}{RESET_COLOR}" if color and config.LOG_COLOR else line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=config.LOG_LEVEL, fmt=config.LOG_FORMAT):
+    """Route all logging through a queue drained by a background thread."""
+    stream_handler = logging.StreamHandler()
+    if fmt == "json":
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ExceptionQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+_listener = setup_logging()
 
 logger = logging.getLogger("assistant")
 
+
 def debug(message):
-    """Log debug message with yellow color."""
-    print(f"\n{YELLOW}[DEBUG] {message}{RESET_COLOR}")
+    """Log debug message."""
+    logger.debug(message)
+
 
 def info(message):
     """Log info message."""
-    print(f"[LOG] {message}")
+    logger.info(message)
+
+
+def warning(message):
+    """Log warning message."""
+    logger.warning(message)
+
 
 def user_message(message):
-    """Format user message with cyan color."""
-    print(f"\n{CYAN}You: {message}{RESET_COLOR}")
-
-# def assistant_message(message):
-#     """Format assistant message with pink color."""
-#     # Split message into English and Chinese parts
-#     parts = message.split('\n\n', 1)
-    
-#     if len(parts) == 2:
-#         # Bilingual message
-#         english_part, chinese_part = parts
-        
-#         # Print English part with Assistant prefix
-#         print(f"\n{NEON_GREEN}Assistant: {PINK}{english_part}{RESET_COLOR}")
-        
-#         # Print Chinese part without Assistant prefix, but with proper indentation
-#         # Add spaces to align with the "Assistant: " prefix (11 characters)
-#         indent = " " * 11
-#         print(f"{PINK}{indent}{chinese_part}{RESET_COLOR}")
-#     else:
-#         # Single language message
-#         print(f"\n{NEON_GREEN}Assistant: {PINK}{message}{RESET_COLOR}")
+    """Log the user's message."""
+    logger.info(f"{CYAN}You: {message}{RESET_COLOR}" if config.LOG_COLOR else f"You: {message}")
+
 
 def assistant_message(message):
-    """Format assistant message with pink color."""
-    
-    # Print English part with Assistant prefix
-    print(f"\n{NEON_GREEN}Assistant: {PINK}{message["english"]}{RESET_COLOR}")
-    
-    # Print Chinese part without Assistant prefix, but with proper indentation
-    # Add spaces to align with the "Assistant: " prefix (11 characters)
-    indent = " " * 11
-    print(f"{PINK}{indent}{message["chinese"]}{RESET_COLOR}")
+    """Log the assistant's bilingual reply."""
+    if config.LOG_COLOR:
+        logger.info(f"{NEON_GREEN}Assistant: {PINK}{message['english']} / {message['chinese']}{RESET_COLOR}")
+    else:
+        logger.info(f"Assistant: {message['english']} / {message['chinese']}")
 
 
 def error(message, exception=None):
-    """Log error message."""
-    print(f"[ERROR] {message}")
-    if exception:
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+    """Log error message, with the traceback when an exception is given."""
+    logger.error(message, exc_info=exception)
@@ -0,0 +1,184 @@
+"""Text utility functions."""
+import re
+
+# Sentence-ending punctuation followed by whitespace; CJK punctuation needs no space after it
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+|(?<=[。！？…])\s*')
+
+# Clause-level punctuation, used to split sentences that are too long
+CLAUSE_BREAK = re.compile(r'(?<=[,;:])\s+|(?<=[，、；：])\s*')
+
+# CJK characters and full-width punctuation, which are not separated by spaces
+CJK_CHAR = re.compile(r'[\u3000-\u9fff\uff00-\uffef]')
+
+
+def _join(left, right):
+    """Join two text pieces, adding a space only between non-CJK text."""
+    if not left:
+        return right
+    if not right:
+        return left
+    if CJK_CHAR.match(left[-1]) or CJK_CHAR.match(right[0]):
+        return left + right
+    return left + " " + right
+
+
+def _hard_split(text, limit):
+    """Split text longer than ``limit`` at clauses, then words, then characters.
+
+    Returns ``(piece, glued)`` pairs, where ``glued`` marks a piece that starts
+    in the middle of a word and must be joined to the previous one without a space.
+    """
+    pieces = []
+    current = ""
+    current_glued = False
+    for part in (p.strip() for p in CLAUSE_BREAK.split(text)):
+        if not part:
+            continue
+        part_glued = False
+        while len(part) > limit:
+            cut = part.rfind(" ", 0, limit + 1)
+            if current:
+                pieces.append((current, current_glued))
+                current = ""
+            if cut > 0:
+                pieces.append((part[:cut].strip(), part_glued))
+                part_glued = False
+            else:
+                cut = limit
+                pieces.append((part[:cut], part_glued))
+                part_glued = True
+            part = part[cut:].strip()
+        if current and len(_join(current, part)) > limit:
+            pieces.append((current, current_glued))
+            current, current_glued = part, part_glued
+        else:
+            if not current:
+                current_glued = part_glued
+            current = _join(current, part)
+    if current:
+        pieces.append((current, current_glued))
+    return pieces
+
+
+def segment_sizes_for_throughput(overhead_seconds, chars_per_second,
+                                 target_first_audio_seconds=1.0, speech_chars_per_second=15.0,
+                                 min_length=20, max_length=400, min_first_length=60):
+    """Derive AdaptiveSegmenter sizes from measured TTS throughput.
+
+    The first segment is sized so it is synthesized within
+    ``target_first_audio_seconds``. Each later segment may be as long as can be
+    synthesized while the previous one plays (spoken at roughly
+    ``speech_chars_per_second``), which gives the growth factor. The cap is the
+    length at which the fixed per-call overhead drops below 10% of the call.
+    The first segment is never shorter than ``min_first_length``, about one
+    spoken sentence: when the overhead alone uses up the target, a shorter
+    segment would not arrive sooner and would only cut the first sentence apart.
+    """
+    chars_per_second = max(chars_per_second, 1.0)
+    overhead_seconds = max(overhead_seconds, 0.0)
+
+    first_length = int((target_first_audio_seconds - overhead_seconds) * chars_per_second)
+    cap = int(10 * overhead_seconds * chars_per_second) or max_length
+    max_length = max(min_length, min(max_length, cap))
+    first_length = max(min_length, min(max(first_length, min_first_length), max_length))
+    growth = max(1.0, chars_per_second / speech_chars_per_second * 0.8)
+
+    return {
+        "first_length": first_length,
+        "growth": growth,
+        "max_length": max_length,
+        "min_length": min_length
+    }
+
+
+class AdaptiveSegmenter:
+    """Cut text into TTS segments that start short and grow along the reply.
+
+    A short first segment keeps time-to-first-audio low; later segments grow by
+    ``growth`` up to ``max_length`` so fewer TTS calls pay the per-call overhead.
+    Text can be fed incrementally as an LLM streams it (``feed``/``flush``) or
+    split in one go (``split``). Segments end at sentence boundaries (ASCII or
+    CJK) where possible, and overlong sentences are split at clauses or words.
+    """
+
+    def __init__(self, first_length=80, growth=2.0, max_length=250, min_length=20, fill=0.5):
+        """Initialize the segmenter.
+
+        A segment is cut once it holds at least ``fill`` of its budget, or when
+        the next sentence would not fit. Segments shorter than ``min_length`` are
+        held back and joined with the next sentence, so that "Hi!" does not
+        become its own TTS request.
+        """
+        self.max_length = max(max_length, min_length)
+        self.budget = max(min(first_length, self.max_length), min_length)
+        self.growth = max(growth, 1.0)
+        self.min_length = min_length
+        self.fill = fill
+        self.buffer = ""
+        self.current = ""
+
+    def _emit(self, segments):
+        segments.append(self.current)
+        self.current = ""
+        self.budget = min(self.max_length, int(self.budget * self.growth))
+
+    def _add_sentence(self, sentence, segments):
+        if len(sentence) > self.budget:
+            pieces = _hard_split(sentence, self.budget)
+        else:
+            pieces = [(sentence, False)]
+
+        for piece, glued in pieces:
+            joined = self.current + piece if glued else _join(self.current, piece)
+            if self.current and len(joined) > self.budget and len(self.current) >= self.min_length:
+                self._emit(segments)
+                joined = piece
+            self.current = joined
+            if len(self.current) >= self.budget * self.fill and len(self.current) >= self.min_length:
+                self._emit(segments)
+
+    def feed(self, text):
+        """Add streamed text and return any segments completed by it."""
+        if not text:
+            return []
+
+        self.buffer += text
+        parts = SENTENCE_BREAK.split(self.buffer)
+
+        # The last part has no trailing break yet, keep it buffered
+        self.buffer = parts.pop()
+
+        segments = []
+        for part in parts:
+            part = part.strip()
+            if part:
+                self._add_sentence(part, segments)
+        return segments
+
+    def flush(self):
+        """Return the segments left in the buffer."""
+        segments = []
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        if remainder:
+            self._add_sentence(remainder, segments)
+        if self.current:
+            segments.append(self.current)
+            self.current = ""
+        return segments
+
+    def split(self, text):
+        """Split a complete text into segments."""
+        return self.feed(text) + self.flush()
+
+
+def estimate_tokens(text):
+    """Estimate the number of LLM tokens in ``text`` without a tokenizer.
+
+    English averages about four characters per token; CJK characters are
+    counted as one token each.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
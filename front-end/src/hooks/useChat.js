@@ -1,6 +1,10 @@
 import { useState, useCallback, useRef, useEffect } from 'react';
 import { API_URL } from '../config';
 
+// 请求的流式音频编码：浏览器能播放Ogg/Opus时使用opus（体积更小），否则使用wav
+const STREAM_AUDIO_FORMAT = typeof Audio !== 'undefined' &&
+  new Audio().canPlayType('audio/ogg; codecs="opus"') ? 'opus' : 'wav';
+
 // 简化的基于Promise的分片播放器
 const PromisePlayer = {
   segmentsByMessage: {}, // 存储格式: { messageId: { 0: segment0, 1: segment1, ... } }
@@ -152,9 +156,10 @@ const PromisePlayer = {
           reject(new Error(`播放错误: ${audio.error?.message || '未知错误'}`));
         };
         
-        // 设置音频源
+        // 设置音频源，按服务端返回的MIME类型（data URL中去掉codecs等参数）
         const base64Audio = segment.audio_data;
-        audio.src = `data:audio/wav;base64,${base64Audio}`;
+        const mimeType = (segment.mime_type || 'audio/wav').split(';')[0].trim();
+        audio.src = `data:${mimeType};base64,${base64Audio}`;
         
         // 播放音频
         const playPromise = audio.play();
@@ -281,7 +286,7 @@ export default function useChat({ playAudioResponse } = {}) {
   // 处理接收到的音频数据
   const handleAudioData = useCallback(async (messageData) => {
     try {
-      const { message_id, segment_index, total_segments, audio_data, sample_rate, english, chinese } = messageData;
+      const { message_id, segment_index, total_segments, audio_data, sample_rate, format, mime_type, english, chinese } = messageData;
       console.log(`处理音频段落 ${segment_index}/${total_segments}`);
       
       // 更新UI状态
@@ -301,8 +306,10 @@ export default function useChat({ playAudioResponse } = {}) {
       
       // 添加到Promise播放器
       PromisePlayer.addSegment(message_id, segment_index, {
-          audio_data,
+        audio_data,
         sample_rate,
+        format,
+        mime_type,
         total_segments,
         english,
         chinese
@@ -392,7 +399,8 @@ export default function useChat({ playAudioResponse } = {}) {
       message_id: messageId,
       audio_data: segment.audio_data,
       type: 'audio',
-      format: 'wav',
+      format: segment.format || 'wav',
+      mime_type: segment.mime_type || 'audio/wav',
       sample_rate: segment.sample_rate,
       english: cache.english || "",
       chinese: cache.chinese || "",
@@ -485,7 +493,8 @@ export default function useChat({ playAudioResponse } = {}) {
         body: JSON.stringify({
           message: message,
           speaker: speaker,
-          stream_audio: true
+          stream_audio: true,
+          audio_format: STREAM_AUDIO_FORMAT
         })
       });
       
@@ -618,7 +627,8 @@ export default function useChat({ playAudioResponse } = {}) {
         body: JSON.stringify({
           audio_data: audioBase64,
           speaker: speaker,
-          stream_audio: true
+          stream_audio: true,
+          audio_format: STREAM_AUDIO_FORMAT
         })
       });
       
@@ -48,7 +48,7 @@ export function createAudioPlayer() {
   const audioContext = new (window.AudioContext || window.webkitAudioContext)();
   
   const play = async (audioData) => {
-    // 处理 Base64 编码的 WAV 音频
+    // 处理 Base64 编码的音频（WAV、Ogg/Opus或FLAC，由mime_type指明）
     if (audioData.audio_data && audioData.isBase64) {
       try {
         // 创建 Blob
@@ -59,7 +59,7 @@ export function createAudioPlayer() {
         }
         
         // 创建一个带有适当MIME类型的Blob
-        const blob = new Blob([byteArray], { type: 'audio/wav' });
+        const blob = new Blob([byteArray], { type: audioData.mime_type || 'audio/wav' });
         
         // 解码音频
         const arrayBuffer = await blob.arrayBuffer();
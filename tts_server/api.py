@@ -39,12 +39,20 @@ os.makedirs("outputs", exist_ok=True)
 
 # 文本分段函数
 def split_text(text: str, max_length: int = 100) -> List[str]:
+    # TTS服务器单独部署，不依赖back-end代码，因此保留自己的分割函数，只需与back-end的
+    # AdaptiveSegmenter保持一致地识别中英文句末和分句标点。back-end发来的段落已按句切分，
+    # 通常不超过max_length，这里只是对超长文本的兜底
     # 如果文本长度小于max_length，直接返回
     if len(text) <= max_length:
         return [text]
     
-    # 定义分隔符优先级（从高到低）
-    separators = ['. ', '! ', '? ', '; ', ', ', ' ']
+    # 定义分隔符优先级（从高到低），同级分隔符取最靠后的一个；中文标点后不需要空格
+    separator_levels = [
+        ['. ', '! ', '? ', '。', '！', '？'],
+        ['; ', '；'],
+        [', ', '，', '、'],
+        [' ']
+    ]
     
     segments = []
     while len(text) > max_length:
@@ -52,11 +60,11 @@ def split_text(text: str, max_length: int = 100) -> List[str]:
         segment_end = -1
         
         # 按优先级尝试不同的分隔符
-        for sep in separators:
+        for separators in separator_levels:
             # 在允许范围内寻找最后一个分隔符
-            pos = text[:max_length].rfind(sep)
-            if pos > 0:  # 找到了分隔符
-                segment_end = pos + len(sep)
+            ends = [text[:max_length].rfind(sep) + len(sep) for sep in separators if text[:max_length].rfind(sep) > 0]
+            if ends:  # 找到了分隔符
+                segment_end = max(ends)
                 break
         
         # 如果没找到任何分隔符，就在词边界处分割